@@ -9,15 +9,24 @@ from instance.config import app_config
 
 db = SQLAlchemy()
 
-from app.mail import mail
+from app import cache, snapshot, transaction
+from app import sweeper, stock, hub
+from app.mail import mail, init_sender
+from app.hashing import hasher
 from app.blueprints.auth import auth
 from app.exceptions import handler
+from app.middlewares.auth import init_jwt_claims
 from app.resources.meals import MealResource, MealListResource
-from app.resources.menu import MenuResource, MenuListResource
+from app.resources.menu import (MenuResource, MenuListResource,
+                                TodayMenuResource)
 from app.resources.menu_items import MenuItemResource, MenuItemListResource
-from app.resources.orders import OrderResource, OrderListResource
+from app.resources.orders import (OrderResource, OrderListResource,
+                                  OrderCartResource, OrderStatusResource)
 from app.resources.notifications import (NotificationResource,
-                                         NotificationListResource)
+                                         NotificationListResource,
+                                         NotificationReadResource,
+                                         NotificationUnreadResource,
+                                         NotificationStreamResource)
 from app.resources.users import UserResource, UserListResource
 
 
@@ -41,22 +50,45 @@ def create_app(config_name):
     api.add_resource(MealListResource, '/meals')
     api.add_resource(MenuResource, '/menus/<int:menu_id>')
     api.add_resource(MenuListResource, '/menus')
+    api.add_resource(TodayMenuResource, '/menus/today')
     api.add_resource(MenuItemResource, '/menu-items/<int:menu_item_id>')
     api.add_resource(MenuItemListResource, '/menu-items')
     api.add_resource(OrderResource, '/orders/<int:order_id>')
     api.add_resource(OrderListResource, '/orders')
+    api.add_resource(OrderCartResource, '/orders/cart')
+    api.add_resource(OrderStatusResource, '/orders/status')
     api.add_resource(UserResource, '/users/<int:user_id>')
     api.add_resource(UserListResource, '/users')
     api.add_resource(NotificationResource,
                      '/notifications/<int:notification_id>')
     api.add_resource(NotificationListResource, '/notifications')
+    api.add_resource(NotificationReadResource, '/notifications/read',
+                     '/notifications/<int:notification_id>/read')
+    api.add_resource(NotificationUnreadResource,
+                     '/notifications/unread-count')
+    api.add_resource(NotificationStreamResource, '/notifications/stream')
 
     # initialize the database
     db.init_app(app)
+    # one transaction per request
+    transaction.init_app(app)
+    # in-process caches
+    cache.init_app(app)
+    snapshot.init_app(app)
+    stock.init_app(app)
+    # wakes the requests waiting for new notifications
+    hub.init_app(app)
     # application exceptions handler
     handler.init_app(app)
     # jwt blacklists handler
     handler.init_jwt(jwt)
+    # user id and role carried in the tokens
+    init_jwt_claims(jwt)
     # mail service
     mail.init_app(app)
+    init_sender(app)
+    # password hashing
+    hasher.init_app(app)
+    # expired tokens and password resets
+    sweeper.init_app(app)
     return app
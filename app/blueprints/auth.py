@@ -1,14 +1,15 @@
 """This handles user authentication"""
 
 import os
-from app.utils import rand_string
+from app import db
+from app.cache import revoked_tokens
+from app.utils import rand_string, current_user
 from app.middlewares.validation import validate
 from app.models import User, Blacklist, PasswordReset
 from app.middlewares.auth import admin_auth, user_auth
 from app.mail import email_verification_mail, password_reset_mail
 from flask import Blueprint, request, jsonify, make_response, current_app
-from flask_jwt_extended import (create_access_token, get_jwt_identity,
-                                get_raw_jwt)
+from flask_jwt_extended import create_access_token, get_raw_jwt
 from app.requests.auth import (LoginRequest, RegisterRequest,
                                EmailVerificationRequest, PasswordResetRequest,
                                MakePasswordResetRequest)
@@ -36,14 +37,8 @@ def register():
                     'Please verify your email to proceed.')
     }
     if env == 'production':
-        try:
-            email_verification_mail(token=user.token, recipient=user.email)
-        except Exception:
-            user.delete()
-            return jsonify({
-                'success': False,
-                'message': 'Connection error. Please try again.',
-            }), 400
+        # the mail sender delivers it in the background
+        email_verification_mail(token=user.token, recipient=user.email)
         return jsonify(resp), 201
     elif env == 'development':
         resp['token'] = user.token
@@ -93,13 +88,7 @@ def make_password_reset():
 
     env = current_app.config['ENV']
     if env == 'production':
-        try:
-            password_reset_mail(token=token, recipient=email)
-        except Exception:
-            return jsonify({
-                'success': False,
-                'message': 'Connection error. Please try again.'
-            }), 400
+        password_reset_mail(token=token, recipient=email)
         return jsonify(resp)
     else:
         resp['token'] = token
@@ -134,13 +123,19 @@ def password_reset():
 def login():
     """Logs in a user using JwT and responds with an access token"""
 
-    user = User.query.filter_by(email=request.json['email']).first()
+    # emails are unique whatever their case, as is the lower() index used
+    user = User.query.filter(db.func.lower(User.email) == db.func.lower(
+        request.json['email'])).first()
     if not user or not user.validate_password(request.json['password']):
         return jsonify({
             'success': False,
             'message': 'Invalid credentials',
         }), 400
 
+    # rehash passwords made with a previous cost factor
+    if user.password_needs_rehash():
+        user.update({'password': request.json['password']})
+
     env = current_app.config['ENV']
     if env in ['production', 'development'] and user.token != '':
         return jsonify({
@@ -150,7 +145,7 @@ def login():
                         ' Please verify your email address')
         }), 400
 
-    token = create_access_token(identity=request.json['email'])
+    token = create_access_token(identity=user)
     return jsonify({
         'success': True,
         'message': 'Successfully logged in',
@@ -164,7 +159,7 @@ def login():
 def get_user():
     """Returns the authencicated users details"""
 
-    user = User.query.filter_by(email=get_jwt_identity()).first()
+    user = current_user()
     return jsonify({
         'success': True,
         'message': 'Successfully retrieved user',
@@ -181,4 +176,5 @@ def logout():
     jti = get_raw_jwt()['jti']
     blacklist = Blacklist(token=jti)
     blacklist.save()
+    revoked_tokens().add(jti)
     return jsonify({'success': True, 'message': 'Successfully logged out.'})
@@ -0,0 +1,164 @@
+"""In-process caches kept by every application worker"""
+
+import time
+from threading import Lock
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app, has_app_context
+
+
+class TTLCache:
+    """A bounded, least recently used cache whose entries expire after
+    a number of seconds"""
+
+    def __init__(self, size=1024, ttl=30):
+        self.size = size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            # stale entries are dropped on read...
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            # evict least recently used...
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RevokedTokens:
+    """The JTIs of signed out tokens, mirrored from the blacklist table.
+
+    Rows added by other workers are picked up by polling for ids above
+    the highest one seen, at most once every `poll_interval` seconds, and
+    entries are dropped once the tokens they revoke have expired."""
+
+    def __init__(self, expires, poll_interval=5):
+        self.expires = expires
+        self.poll_interval = poll_interval
+        self._tokens = {}
+        self._high_water = None
+        self._polled_at = None
+        self._lock = Lock()
+
+    def is_revoked(self, jti):
+        with self._lock:
+            if self._polled_at is None or \
+                    time.monotonic() - self._polled_at >= self.poll_interval:
+                self._poll()
+            return jti in self._tokens
+
+    def add(self, jti):
+        """Revoke a token signed out through this worker"""
+        with self._lock:
+            self._tokens[jti] = self._expiry(
+                max(datetime.now(), datetime.utcnow()))
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._high_water = None
+            self._polled_at = None
+
+    def _poll(self):
+        from app.models import Blacklist
+
+        query = Blacklist.query.with_entities(
+            Blacklist.id, Blacklist.token, Blacklist.created_at)
+        # only the rows added since the last poll...
+        if self._high_water is not None:
+            query = query.filter(Blacklist.id > self._high_water)
+
+        for row_id, token, created_at in query.order_by(Blacklist.id):
+            self._tokens[token] = self._expiry(created_at or datetime.utcnow())
+            self._high_water = row_id
+        self._polled_at = time.monotonic()
+        self._prune()
+
+    def _prune(self):
+        now = self._now()
+        for jti in [jti for jti, expiry in self._tokens.items() if expiry < now]:
+            del self._tokens[jti]
+
+    def _expiry(self, created_at):
+        return created_at + self.expires
+
+    @staticmethod
+    def _now():
+        # the database may keep either local or UTC time, so err on the side
+        # of keeping revoked tokens for longer than they can be used
+        return min(datetime.now(), datetime.utcnow())
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+def init_app(app):
+    """Setup the application's caches from its configuration"""
+    size = app.config.get('IDENTITY_CACHE_SIZE')
+    ttl = app.config.get('IDENTITY_CACHE_TTL', 30)
+    if size:
+        app.extensions['identity_cache'] = TTLCache(size=size, ttl=ttl)
+        app.extensions['token_versions'] = TTLCache(size=size, ttl=ttl)
+    else:
+        app.extensions['identity_cache'] = None
+        app.extensions['token_versions'] = None
+
+    size = app.config.get('IDEMPOTENCY_CACHE_SIZE')
+    app.extensions['idempotency_cache'] = TTLCache(
+        size=size, ttl=app.config['IDEMPOTENCY_KEY_EXPIRES'].total_seconds()
+    ) if size else None
+
+    app.extensions['revoked_tokens'] = RevokedTokens(
+        expires=app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+        poll_interval=app.config.get('REVOKED_TOKENS_POLL_INTERVAL', 5))
+
+
+def identity_cache():
+    """Returns the JWT identity cache of the current application if any"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('identity_cache')
+
+
+def token_versions():
+    """Returns the users' token versions cache, keyed by user id"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('token_versions')
+
+
+def revoked_tokens():
+    """Returns the signed out tokens of the current application"""
+    return current_app.extensions['revoked_tokens']
+
+
+def idempotency_cache():
+    """Returns the responses kept by idempotency key if any"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('idempotency_cache')
@@ -3,7 +3,7 @@
 
 import json
 from flask import jsonify
-from app.models import Blacklist
+from app.cache import revoked_tokens
 from werkzeug.exceptions import default_exceptions
 from . import ValidationException
 
@@ -33,6 +33,5 @@ def init_jwt(jwt):
     """Handles the JWT blacklists for logged out users."""
     @jwt.token_in_blacklist_loader
     def check_token_in_blacklist(decrypted_token):
-        return Blacklist.query.filter_by(
-                    token=decrypted_token['jti']).first() is not None
+        return revoked_tokens().is_revoked(decrypted_token['jti'])
 
@@ -0,0 +1,68 @@
+"""Password hashing kept off the request thread"""
+
+from threading import Lock
+from passlib.hash import bcrypt
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _hash(password, rounds):
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify(password, hashed):
+    return bcrypt.verify(password, hashed)
+
+
+class Hasher:
+    """Hashes and verifies passwords with bcrypt in a bounded pool of
+    processes. With no pool size configured the work is done inline."""
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool_size = 0
+        self._pool = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.pool_size = app.config.get('HASHING_POOL_SIZE', 0)
+        self.shutdown()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run(_verify, password, hashed)
+
+    def needs_update(self, hashed):
+        """Checks if the hash was made with a different cost factor"""
+        return bcrypt.using(rounds=self.rounds).needs_update(hashed)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self.pool_size:
+            return fn(*args)
+
+        # pool is started on first use, i.e. after the server forks...
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+            pool = self._pool
+
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # a pool process died, start afresh on the next call
+            self.shutdown()
+            return fn(*args)
+
+
+hasher = Hasher()
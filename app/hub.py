@@ -0,0 +1,151 @@
+"""Wakes the requests waiting for their users' new notifications"""
+
+import time
+import select
+import logging
+from threading import Lock, Condition, Thread
+from flask import current_app, has_app_context
+from sqlalchemy.engine.url import make_url
+from app import db, transaction
+
+# the Postgres channel the workers publish the users' ids on
+CHANNEL = 'notifications'
+
+
+class NotificationHub:
+    """Versions of the users' notifications, bumped as new ones are made,
+    that the requests waiting for them block on so that idle clients cost
+    nothing in the database. When broadcasting, notifications are published
+    through Postgres to every worker, whose listener is started by its first
+    waiting request."""
+
+    def __init__(self, broadcast=False):
+        self.broadcast = broadcast
+        self._listening = False
+        self._lock = Lock()
+        self._versions = {}
+        # user id: the condition its requests wait on and their count
+        self._waiting = {}
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def publish(self, user_id):
+        """Wake the requests waiting for the user's notifications"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            waiting = self._waiting.get(user_id)
+            if waiting is not None:
+                waiting[0].notify_all()
+
+    def publish_all(self):
+        """Wake all the waiting requests to look for their notifications,
+        as some may have been missed"""
+        with self._lock:
+            for user_id, waiting in self._waiting.items():
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                waiting[0].notify_all()
+
+    def listen(self, app):
+        """Start listening for the notifications broadcast by the workers,
+        once the channel is listened to so that none is missed"""
+        if not self.broadcast:
+            return
+        with self._lock:
+            if self._listening:
+                return
+            with app.app_context():
+                connection = _listening_connection()
+            Thread(target=_listen, args=(app, self, connection),
+                   name='notification-listener', daemon=True).start()
+            self._listening = True
+
+    def wait(self, user_id, version, timeout):
+        """Block until the user's notifications move on from the version
+        or the timeout passes. Returns whether they moved on."""
+        with self._lock:
+            waiting = self._waiting.setdefault(
+                user_id, [Condition(self._lock), 0])
+            waiting[1] += 1
+            try:
+                return waiting[0].wait_for(
+                    lambda: self._versions.get(user_id, 0) != version,
+                    timeout)
+            finally:
+                waiting[1] -= 1
+                if not waiting[1]:
+                    del self._waiting[user_id]
+
+
+def notify(user_ids):
+    """Publish the new notifications of the users once they are committed,
+    through Postgres to every worker when broadcasting"""
+    hub = notification_hub()
+    if hub is None or not user_ids:
+        return
+    if hub.broadcast:
+        # delivered by Postgres on commit...
+        db.session.execute(
+            'SELECT pg_notify(:channel, id::text) FROM unnest(:ids) AS id',
+            {'channel': CHANNEL, 'ids': list(user_ids)})
+        return
+
+    def publish():
+        for user_id in user_ids:
+            hub.publish(user_id)
+    transaction.on_commit(publish)
+
+
+def _listening_connection():
+    connection = db.engine.raw_connection()
+    try:
+        dbapi_connection = connection.connection
+        dbapi_connection.set_isolation_level(0)
+        dbapi_connection.cursor().execute('LISTEN ' + CHANNEL)
+    except Exception:
+        connection.invalidate()
+        raise
+    return connection
+
+
+def _listen(app, hub, connection):
+    """Publish the users' ids notified on the channel by any worker"""
+    while True:
+        try:
+            if connection is None:
+                with app.app_context():
+                    connection = _listening_connection()
+                # some may have been sent while not listening...
+                hub.publish_all()
+            try:
+                dbapi_connection = connection.connection
+                while True:
+                    if not select.select([dbapi_connection], [], [], 60)[0]:
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        hub.publish(int(notify.payload))
+            finally:
+                connection.invalidate()
+                connection = None
+        except Exception:
+            logging.exception('hub: listening for notifications failed')
+            time.sleep(5)
+
+
+def init_app(app):
+    """Set up the notification hub, broadcasting through Postgres when
+    NOTIFICATION_LISTEN is on"""
+    broadcast = bool(app.config.get('NOTIFICATION_LISTEN')) and make_url(
+        app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == \
+        'postgresql'
+    app.extensions['notification_hub'] = NotificationHub(broadcast)
+
+
+def notification_hub():
+    """Returns the notification hub of the current application if any"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('notification_hub')
@@ -0,0 +1,84 @@
+"""Creates the models' indexes on a live database and reports the tables
+that are still being scanned sequentially"""
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+from app import db, search
+
+# tables looked up by their foreign keys, tokens and unique names
+TABLES = ['orders', 'menu_items', 'notifications', 'password_resets',
+          'blacklist', 'users', 'meals', 'menus', 'idempotency_keys',
+          'outbox']
+
+# the inspector skips expression indexes, so the catalogs are read instead
+CATALOGS = {
+    'postgresql': 'SELECT indexname FROM pg_indexes WHERE tablename = :table',
+    'sqlite': "SELECT name FROM sqlite_master "
+              "WHERE type = 'index' AND tbl_name = :table",
+}
+
+
+def index_names(table):
+    """The names of the indexes of a table found in the database"""
+    catalog = CATALOGS.get(db.engine.dialect.name)
+    if catalog is None:
+        return {index['name'] for index in
+                inspect(db.engine).get_indexes(table)}
+    return {row[0] for row in
+            db.session.execute(catalog, {'table': table}).fetchall()}
+
+
+def missing_indexes(tables=TABLES):
+    """The indexes declared on the models but not found in the database"""
+    missing = []
+    for name in tables:
+        table = db.metadata.tables[name]
+        existing = index_names(name)
+        missing.extend(index for index in sorted(
+            table.indexes, key=lambda index: index.name)
+            if index.name not in existing)
+    return missing
+
+
+def create_indexes(tables=TABLES):
+    """Create the missing indexes. On Postgres they are built with
+    CREATE INDEX CONCURRENTLY so that writes are not blocked, which
+    must run outside of a transaction. Returns the indexes created."""
+    created = []
+    postgres = db.engine.dialect.name == 'postgresql'
+    with db.engine.connect() as connection:
+        if postgres:
+            connection = connection.execution_options(
+                isolation_level='AUTOCOMMIT')
+        for index in missing_indexes(tables):
+            if postgres:
+                index.dialect_options['postgresql']['concurrently'] = True
+            try:
+                connection.execute(CreateIndex(index))
+            finally:
+                if postgres:
+                    index.dialect_options['postgresql']['concurrently'] = False
+            created.append(index)
+    return created
+
+
+def create_search_indexes():
+    """Create the missing search indexes of the models, concurrently on
+    Postgres. Returns their names."""
+    postgres = db.engine.dialect.name == 'postgresql'
+    with db.engine.connect() as connection:
+        if postgres:
+            connection = connection.execution_options(
+                isolation_level='AUTOCOMMIT')
+        return search.create_indexes(connection, concurrently=postgres)
+
+
+def seq_scans(tables=TABLES):
+    """Sequential and index scans of the tables since the statistics were
+    last reset. Only available on Postgres."""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    return db.session.execute(
+        'SELECT relname, seq_scan, seq_tup_read, idx_scan, n_live_tup '
+        'FROM pg_stat_user_tables WHERE relname = ANY(:tables) '
+        'ORDER BY seq_tup_read DESC', {'tables': tables}).fetchall()
@@ -1,35 +1,169 @@
 import os
+import time
+import logging
+from smtplib import SMTPServerDisconnected
+from threading import Thread
+from datetime import datetime, timedelta
+from flask import current_app
 from flask_mail import Mail, Message
-from jinja2 import Environment, PackageLoader, select_autoescape
+from markupsafe import escape
+from jinja2 import (Environment, PackageLoader, ModuleLoader, ChoiceLoader,
+                    select_autoescape)
+from app import db
+from app.models import Outbox
 
 mail = Mail()
-env = Environment(
-    loader=PackageLoader('app', 'templates'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+
+SENDER = 'andela.book.a.meal@gmail.com'
+
+# stands in for the link when rendering the static parts of the mails
+LINK = '__MAIL_LINK__'
+
+_env = None
+_rendered = {}
 
 
 def email_verification_mail(token=None, recipient=None):
     if token is None or recipient is None:
         return
-    template = env.get_template('email_verification.html')
-    msg = Message(
-        'Email Verification',
-        sender='andela.book.a.meal@gmail.com',
-        recipients=[recipient])
-    msg.html = template.render(
-        message={'link': os.getenv('EMAIL_VERIFICATION_ENDPOINT') + token})
-    mail.send(msg)
+    html = render('email_verification.html',
+                  os.getenv('EMAIL_VERIFICATION_ENDPOINT') + token)
+    return queue_mail('Email Verification', recipient, html)
 
 
 def password_reset_mail(token=None, recipient=None):
     if token is None or recipient is None:
         return
-    template = env.get_template('password_reset.html')
-    msg = Message(
-        'Password Reset',
-        sender='andela.book.a.meal@gmail.com',
-        recipients=[recipient])
-    msg.html = template.render(
-        message={'link': os.getenv('PASSWORD_RESET_ENDPOINT') + token})
-    mail.send(msg)
+    html = render('password_reset.html',
+                  os.getenv('PASSWORD_RESET_ENDPOINT') + token)
+    return queue_mail('Password Reset', recipient, html)
+
+
+def render(name, link):
+    """Render a mail template for the given link. The rest of the template
+    is only rendered once and kept for the next mails."""
+    parts = _rendered.get(name)
+    if parts is None:
+        template = environment().get_template(name)
+        parts = _rendered[name] = template.render(
+            message={'link': LINK}).split(LINK)
+    return str(escape(link)).join(parts)
+
+
+def environment():
+    """The mail templates environment, built on first use. Templates
+    compiled by `manage.py compile_templates` are loaded when present."""
+    global _env
+    if _env is None:
+        loaders = [PackageLoader('app', 'templates')]
+        compiled = current_app.config.get('MAIL_COMPILED_TEMPLATES')
+        if compiled and os.path.isdir(compiled):
+            loaders.insert(0, ModuleLoader(compiled))
+        _env = _make_environment(ChoiceLoader(loaders))
+    return _env
+
+
+def compile_templates(target):
+    """Compile the mail templates ahead of time into python modules"""
+    global _env
+    _make_environment(PackageLoader('app', 'templates')).compile_templates(
+        target, zip=None)
+    # pick up the compiled templates on the next render...
+    _env = None
+    _rendered.clear()
+
+
+def _make_environment(loader):
+    return Environment(
+        loader=loader,
+        autoescape=select_autoescape(['html', 'xml'])
+    )
+
+
+def queue_mail(subject, recipient, html):
+    """Save the mail to the outbox for the sender to deliver"""
+    return Outbox.create({
+        'subject': subject,
+        'recipient': recipient,
+        'html': html
+    })
+
+
+def send_queued_mail():
+    """Deliver a batch of the queued mails over a single SMTP connection,
+    connected again once if the server drops it. Failed mails are retried
+    later with an exponential backoff. Returns the count of mails sent."""
+    config = current_app.config
+    max_attempts = config['MAIL_MAX_ATTEMPTS']
+    queued = Outbox.due(max_attempts, config['MAIL_BATCH_SIZE'])
+    if not queued:
+        db.session.commit()
+        return 0
+
+    sent = 0
+    unsent = list(queued)
+    error = None
+    for attempt in range(2):
+        try:
+            with mail.connect() as connection:
+                while unsent:
+                    outbox = unsent[0]
+                    message = Message(
+                        outbox.subject,
+                        sender=SENDER,
+                        recipients=[outbox.recipient])
+                    message.html = outbox.html
+                    try:
+                        connection.send(message)
+                    except SMTPServerDisconnected:
+                        raise
+                    except Exception as ex:
+                        _retry_later(outbox, ex)
+                    else:
+                        outbox.sent_at = datetime.utcnow()
+                        sent += 1
+                    unsent.pop(0)
+            break
+        except SMTPServerDisconnected as ex:
+            # the mail being sent is sent again over a new connection...
+            error = ex
+        except Exception as ex:
+            # could not connect to the SMTP server...
+            error = ex
+            break
+    for outbox in unsent:
+        _retry_later(outbox, error)
+
+    db.session.commit()
+    return sent
+
+
+def _retry_later(outbox, ex):
+    outbox.attempts = (outbox.attempts or 0) + 1
+    outbox.last_error = str(ex)[:1024]
+    backoff = current_app.config['MAIL_RETRY_BACKOFF']
+    outbox.send_after = datetime.utcnow() + timedelta(
+        seconds=backoff * 2 ** (outbox.attempts - 1))
+
+
+def send_forever(app, interval):
+    """Send the queued mail every interval seconds"""
+    while True:
+        with app.app_context():
+            try:
+                # keep going while full batches are being sent...
+                while send_queued_mail() >= app.config['MAIL_BATCH_SIZE']:
+                    pass
+            except Exception:
+                db.session.rollback()
+                logging.exception('mail: sending queued mail failed')
+        time.sleep(interval)
+
+
+def init_sender(app):
+    """Start the background mail sender if an interval is configured"""
+    interval = app.config.get('MAIL_SEND_INTERVAL')
+    if not interval:
+        return
+    Thread(target=send_forever, args=(app, interval), name='mail-sender',
+           daemon=True).start()
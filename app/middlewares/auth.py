@@ -1,5 +1,5 @@
 from functools import wraps
-from app.utils import current_user
+from app.utils import current_principal
 from flask import jsonify, make_response, abort
 from flask_jwt_extended import jwt_required
 
@@ -15,7 +15,7 @@ def admin_auth(fn):
     @wraps(fn)
     @user_auth
     def wrapper(*args, **kwargs):
-        if not current_user().is_admin():
+        if not current_principal().is_admin():
             abort(
                 make_response(
                     jsonify({'message': 'Unauthorized access to a non-admin'}),
@@ -24,3 +24,19 @@ def admin_auth(fn):
             )
         return fn(*args, **kwargs)
     return wrapper
+
+
+def init_jwt_claims(jwt):
+    """Carries the user's id and role in the tokens so that the
+    authorization checks need not load the user"""
+    @jwt.user_identity_loader
+    def user_identity(user):
+        return user.email
+
+    @jwt.user_claims_loader
+    def user_claims(user):
+        return {
+            'user_id': user.id,
+            'role': user.role,
+            'version': user.token_version or 0,
+        }
@@ -0,0 +1,87 @@
+import json
+import hashlib
+import logging
+from functools import wraps
+from flask import request
+from sqlalchemy.exc import IntegrityError
+from app import transaction
+from app.cache import idempotency_cache
+from app.models import IdempotencyKey
+from app.utils import current_principal
+
+HEADER = 'Idempotency-Key'
+
+
+def idempotent(fn):
+    """Answers the requests retried with the same Idempotency-Key header
+    with the response to the first, without running them again. Goes
+    after the authentication and before the validation."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 256:
+            return _error('The idempotency key must not be greater than '
+                          '256 characters.', 400)
+
+        user_id = current_principal().id
+        made = '{} {}'.format(request.method, request.path)
+        digest = hashlib.sha256(request.get_data()).hexdigest()
+        cache = idempotency_cache()
+        cached = cache.get((user_id, key)) if cache is not None else None
+        if cached is not None:
+            return _replay(made, digest, *cached)
+
+        # claim the key, a concurrent request with it waits for ours...
+        claim = IdempotencyKey(
+            key=key, user_id=user_id, request=made, digest=digest)
+        try:
+            claim.save()
+        except IntegrityError:
+            found = IdempotencyKey.find(user_id, key)
+            if found is None or found.status is None:
+                return _error('A request with this idempotency key is '
+                              'in progress.', 409)
+            return _replay(made, digest, found.request, found.digest,
+                           found.status, found.response)
+
+        try:
+            resp = fn(*args, **kwargs)
+        except Exception:
+            # a retry should be made again, without hiding the error...
+            try:
+                claim.delete()
+            except Exception:
+                logging.exception('idempotency: releasing the key failed')
+            raise
+        if isinstance(resp, tuple):
+            body, status = resp[0], resp[1]
+        else:
+            body, status = resp, 200
+        if status >= 400:
+            claim.delete()
+            return resp
+
+        claim.status = status
+        claim.response = json.dumps(body)
+        claim.save()
+        if cache is not None:
+            entry = made, digest, status, claim.response
+            transaction.on_commit(lambda: cache.set((user_id, key), entry))
+        return resp
+    return wrapper
+
+
+def _replay(made, digest, request_made, request_digest, status, response):
+    if made != request_made:
+        return _error('The idempotency key was used by another request.',
+                      422)
+    if digest != request_digest:
+        return _error('The idempotency key was used with another body.',
+                      422)
+    return json.loads(response), status, {'Idempotent-Replayed': 'true'}
+
+
+def _error(message, status):
+    return {'success': False, 'message': message}, status
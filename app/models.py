@@ -1,10 +1,26 @@
 """Contains the application's database models"""
 
 import json
+import pytz
+import base64
+from functools import lru_cache
+from collections import defaultdict
 from app import db
-from passlib.hash import bcrypt
-from datetime import datetime, date
-from sqlalchemy import cast, or_
+from flask import current_app
+from app.hashing import hasher
+from datetime import datetime, date, timedelta
+from sqlalchemy import cast, or_, and_, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm import (make_transient_to_detached, joinedload,
+                            selectinload, load_only)
+from app.cache import identity_cache, token_versions
+from app.snapshot import today_menu
+from app.exceptions import ValidationException
+from app import transaction
+from app.hub import notify
+from app.search import searchable, matching
 
 
 class BaseModel:
@@ -12,6 +28,11 @@ class BaseModel:
     _fields = []
     _hidden = []
     _timestamps = True
+    # relations that can be requested through the related filter, nested
+    # relations are separated by dots
+    _relations = []
+    # relations always serialized with the model
+    _eager = []
 
     @classmethod
     def make(cls, data):
@@ -26,6 +47,23 @@ class BaseModel:
         instance.save()
         return instance
 
+    @classmethod
+    def create_many(cls, rows):
+        """Insert the rows in a single statement, returning their
+        models in the same order"""
+        if db.session.bind.dialect.name != 'postgresql':
+            instances = [cls.make(row) for row in rows]
+            db.session.add_all(instances)
+            transaction.flush()
+            return instances
+
+        table = cls.__table__
+        ids = [row[0] for row in db.session.execute(
+            table.insert().values(rows).returning(table.c.id))]
+        instances = {instance.id: instance
+                     for instance in cls.query.filter(cls.id.in_(ids))}
+        return [instances[id] for id in ids]
+
     def update(self, data):
         self.from_dict(data)
         self.save()
@@ -34,12 +72,75 @@ class BaseModel:
     def save(self):
         """Save current model"""
         db.session.add(self)
-        db.session.commit()
+        self._commit()
 
     def delete(self):
         """Delete current model"""
         db.session.delete(self)
-        db.session.commit()
+        transaction.flush()
+
+    @staticmethod
+    def _commit():
+        """Commit the session, or flush it when the request commits, and
+        report the values already taken by another row as validation
+        errors"""
+        try:
+            transaction.flush()
+        except IntegrityError as ex:
+            transaction.rollback()
+            field = _unique_field(ex)
+            if field is None:
+                raise
+            from app.validation.translator import trans
+            raise ValidationException({
+                field: [trans('unique', {':field:': field})]
+            })
+
+    @staticmethod
+    def _now():
+        # the database may keep either local or UTC time, so err on the side
+        # of keeping records for longer than their lifetime
+        return min(datetime.now(), datetime.utcnow())
+
+    @classmethod
+    def created_before(cls, lifetime):
+        """Filter for the records older than the given lifetime"""
+        return cls.created_at < cls._now() - lifetime
+
+    @classmethod
+    def prune(cls, lifetime, batch_size=1000):
+        """Delete the records older than the given lifetime in batches so
+        that no long running locks are held. Returns the count deleted."""
+        deleted = 0
+        while True:
+            ids = [row.id for row in db.session.query(cls.id).filter(
+                cls.created_before(lifetime)).limit(batch_size)]
+            if not ids:
+                break
+            cls.query.filter(cls.id.in_(ids)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                break
+        return deleted
+
+    def to_cache(self):
+        """Snapshot of the column values for use by the caches"""
+        return {
+            column.key: getattr(self, column.key)
+            for column in inspect(type(self)).column_attrs
+        }
+
+    @classmethod
+    def from_cache(cls, attributes):
+        """Rebuild a model from its cached snapshot and attach it to the
+        session without querying the database"""
+        instance = cls()
+        for key, value in attributes.items():
+            setattr(instance, key, value)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
 
     @classmethod
     def _apply_db_filters(cls, query, filters):
@@ -63,6 +164,16 @@ class BaseModel:
                 except AttributeError:
                     pass
             else:
+                # full-text search, best matches first
+                matches = matching(cls, filters['search'])
+                if matches is not None:
+                    query = query.join(matches, matches.c.id == cls.id)
+                    # pages by cursor keep to the ids' order
+                    if 'cursor' not in filters:
+                        query = query.order_by(None).order_by(
+                            matches.c.rank.desc(), cls.id.desc())
+                    return query
+
                 # comparison rules
                 predicates = []
 
@@ -92,29 +203,106 @@ class BaseModel:
         else:
             dict_items = [item.to_dict() for item in items]
 
-        fields = None
-        if 'related' in filters:
-            # split the required related models
-            related_models = filters['related'].split('|')
-
-            # for all request models...
-            for model in related_models:
-                # if relation fields are specified...
-                if ':' in model:
-                    # get relation name and required fields
-                    model_name, fields = model.split(':')
-                    fields = fields.split(',')
-                else:
-                    model_name = model
-
-                for item, dict_item in zip(items, dict_items):
-                    #try:
-                    dict_item[model_name] = getattr(
-                        item, model_name).to_dict(fields=fields)
-                    #except AttributeError:
-                        #break
+        # related models have been eager loaded by the query...
+        for path, fields in cls._related(filters):
+            names = path.split('.')
+            for item, dict_item in zip(items, dict_items):
+                # walk down nested relations...
+                related = item
+                for name in names:
+                    related = getattr(related, name) if related else None
+                # ...and feed the result at the same depth
+                for name in names[:-1]:
+                    dict_item = dict_item.setdefault(name, {})
+                dict_item[names[-1]] = related.to_dict(
+                    fields=fields) if related else {}
         return dict_items
 
+    @classmethod
+    def time_filter(cls, time):
+        """Filter for the `time` parameter, i.e. today, history, all or a
+        YYYY-MM-DD date. Days are compared as ranges of created_at so
+        that its index can be used."""
+        # no filter for all...
+        if time == 'all':
+            return None
+
+        # before today...
+        if time == 'history':
+            start, _ = day_bounds(today())
+            return cls.created_at < start
+
+        if time == 'today':
+            day = today()
+        else:
+            from app.utils import str_to_date
+            day = str_to_date(time)
+            if day is None:
+                return None
+        start, end = day_bounds(day)
+        return and_(cls.created_at >= start, cls.created_at < end)
+
+    @classmethod
+    def _related(cls, filters):
+        """Parse the related filter, e.g. `user|menu_item.meal:name,cost`,
+        into the relation paths and their fields. Only the relations
+        whitelisted in `_relations` are kept."""
+        related = []
+        if not filters or 'related' not in filters:
+            return related
+
+        for relation in filters['related'].split('|'):
+            fields = None
+            # if relation fields are specified...
+            if ':' in relation:
+                relation, fields = relation.split(':', 1)
+                fields = fields.split(',')
+            if relation in cls._relations:
+                related.append((relation, fields))
+        return related
+
+    @classmethod
+    def _load_options(cls, filters):
+        """Eager loading options for the relations that will be serialized
+        and the requested fields"""
+        options = []
+        columns = [column.key for column in inspect(cls).column_attrs]
+
+        # only load the requested fields...
+        if filters and 'fields' in filters:
+            fields = [field for field in filters['fields'].split(',')
+                      if field in columns]
+            options.append(load_only(*fields))
+
+        paths = list(cls._eager)
+        paths.extend(path for path, _ in cls._related(filters))
+        for path in paths:
+            options.extend(cls._load_path(path.split('.')))
+        return options
+
+    @classmethod
+    def _load_path(cls, names, option=None):
+        """Loading options for a relation path including the relations
+        serialized with the model at its end"""
+        model = cls
+        for name in names:
+            attribute = getattr(model, name)
+            relation = attribute.property
+            # a collection is fetched with a second query while a single
+            # model is joined
+            if relation.uselist:
+                option = option.selectinload(attribute) if option \
+                    else selectinload(attribute)
+            else:
+                option = option.joinedload(attribute) if option \
+                    else joinedload(attribute)
+            model = relation.mapper.class_
+
+        options = [option]
+        for name in model._eager:
+            options.extend(model._load_path([name], option=option))
+        return options
+
     @classmethod
     def paginate(cls, filters=None, query=None, name='data'):
         # default query passed?
@@ -125,6 +313,13 @@ class BaseModel:
             # query with filters
             query = cls._apply_db_filters(query, filters)
 
+        # eager load what will be serialized
+        query = query.options(*cls._load_options(filters))
+
+        # keyset pagination requested...
+        if filters and 'cursor' in filters:
+            return cls._paginate_cursor(query, filters, name)
+
         paginated = query.paginate(error_out=False)
         return {
             'pages': paginated.pages,
@@ -138,6 +333,51 @@ class BaseModel:
             name: cls._apply_data_filters(paginated.items, filters)
         }
 
+    @classmethod
+    def _paginate_cursor(cls, query, filters, name):
+        """Paginate newest first by seeking past the last id seen instead
+        of counting and offsetting. The cursor is opaque to the clients."""
+        after = cls._decode_cursor(filters['cursor'])
+        if after is not None:
+            query = query.filter(cls.id < after)
+
+        try:
+            per_page = max(int(filters.get('per_page', 20)), 1)
+        except ValueError:
+            per_page = 20
+
+        # one more to know if there is a next page...
+        items = query.limit(per_page + 1).all()
+        has_next = len(items) > per_page
+        items = items[:per_page]
+
+        return {
+            'has_next': has_next,
+            'per_page': per_page,
+            'next_cursor': cls._encode_cursor(items[-1].id)
+            if has_next else None,
+            'current_count': len(items),
+            name: cls._apply_data_filters(items, filters)
+        }
+
+    @staticmethod
+    def _encode_cursor(last_id):
+        return base64.urlsafe_b64encode(
+            json.dumps({'id': last_id}).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        # no cursor for the first page
+        if not cursor:
+            return None
+        try:
+            return int(json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode())['id'])
+        except (ValueError, TypeError, KeyError):
+            from app.validation.translator import trans
+            raise ValidationException(
+                {'cursor': [trans('regex', {':field:': 'cursor'})]})
+
     def from_dict(self, data):
         for field in self._fields:
             if field in data:
@@ -145,48 +385,106 @@ class BaseModel:
         return self
 
     def to_dict(self, fields=None):
+        return _serializer(type(self), tuple(fields) if fields else None)(self)
+
+    def to_json(self, fields=None):
+        return json.dumps(self.to_dict(fields=fields))
+
+
+@lru_cache(maxsize=1024)
+def _serializer(cls, fields):
+    """Compile a function serializing the given fields of a model. These
+    are cached per model and field set so the work of picking the fields
+    is only done once."""
+
+    # if no fields specified, include all..
+    if not fields:
+        fields = tuple(cls._fields) + ('id', 'created_at', 'updated_at')
+
+    # id and timestamps come first...
+    leading = ['id']
+    if cls._timestamps:
+        leading.extend(['created_at', 'updated_at'])
+    names = [name for name in leading if name in fields]
+    names.extend(name for name in fields
+                 if name not in cls._hidden and name not in names)
+
+    columns = {column.key: column for column in inspect(cls).column_attrs}
+    getters = []
+    for name in names:
+        column = columns.get(name)
+        if column is not None:
+            is_date = isinstance(column.columns[0].type, (db.DateTime, db.Date))
+            getters.append((name, _date_value if is_date else None))
+        elif isinstance(getattr(cls, name, None), property):
+            getters.append((name, _value))
+
+    def serialize(instance):
+        loaded = instance.__dict__
         dict_repr = {}
+        for name, convert in getters:
+            # loaded column values are read directly...
+            value = loaded[name] if name in loaded else getattr(instance, name)
+            dict_repr[name] = convert(value) if convert else value
+        return dict_repr
 
-        # if no fields specified, include all..
-        if not fields or len(fields) == 0:
-            fields = self._fields
-            fields.extend(['id', 'created_at', 'updated_at'])
+    return serialize
 
-        if 'id' in fields:
-            try:
-                dict_repr['id'] = getattr(self, 'id')
-            except AttributeError:
-                pass
 
-        # check if timestamps enabled and feed the results
-        if self._timestamps:
-            if 'created_at' in fields:
-                try:
-                    dict_repr['created_at'] = str(getattr(self, 'created_at'))
-                except AttributeError:
-                    pass
-            if 'updated_at' in fields:
-                try:
-                    dict_repr['updated_at'] = str(getattr(self, 'updated_at'))
-                except AttributeError:
-                    pass
+def _date_value(value):
+    return str(value) if value is not None else None
 
-        # for every field declared...
-        for field in fields:
-            # if field is not hidden...
-            if field not in self._hidden:
-                try:
-                    value = getattr(self, field)
-                except AttributeError:
-                    continue
-                if isinstance(value, datetime) or isinstance(value, date):
-                    dict_repr[field] = str(value)
-                else:
-                    dict_repr[field] = value
-        return dict_repr
 
-    def to_json(self, fields=None):
-        return json.dumps(self.to_dict(fields=include))
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    return value
+
+
+def today():
+    """The current date in the application's timezone"""
+    timezone = pytz.timezone(current_app.config['TIMEZONE'])
+    return datetime.now(timezone).date()
+
+
+def day_bounds(day):
+    """The start of the given day and of the next in the application's
+    timezone, as the database keeps its timestamps"""
+    timezone = pytz.timezone(current_app.config['TIMEZONE'])
+    db_timezone = pytz.timezone(current_app.config['DATABASE_TIMEZONE'])
+    bounds = []
+    for start in [day, day + timedelta(days=1)]:
+        start = timezone.localize(datetime.combine(start, datetime.min.time()))
+        bounds.append(start.astimezone(db_timezone).replace(tzinfo=None))
+    return tuple(bounds)
+
+
+def unique_lower(model, column):
+    """Case insensitive unique index on a column of the model, whose
+    violations are reported against the column"""
+    name = 'ix_{}_lower_{}'.format(model.__tablename__, column)
+    _unique_indexes[name] = column
+    return db.Index(
+        name, db.func.lower(getattr(model, column)), unique=True)
+
+
+def _unique_field(error):
+    """The field of the unique index violated by the error if any"""
+    message = str(error.orig)
+    for name, field in _unique_indexes.items():
+        if name in message:
+            return field
+    return None
+
+
+# unique indexes by name and the fields they guard
+_unique_indexes = {}
+
+
+def _today_menu_changed():
+    snapshot = today_menu()
+    if snapshot is not None:
+        transaction.on_commit(snapshot.invalidate)
 
 
 class Blacklist(db.Model, BaseModel):
@@ -196,7 +494,7 @@ class Blacklist(db.Model, BaseModel):
     _fields = ['token']
 
     id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(500))
+    token = db.Column(db.String(500), index=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     def __init__(self, token=None):
@@ -211,9 +509,9 @@ class PasswordReset(db.Model, BaseModel):
     _fields = ['token', 'user_id']
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer,
-                        db.ForeignKey('users.id', ondelete='CASCADE'))
-    token = db.Column(db.String(500))
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    token = db.Column(db.String(500), index=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     user = db.relationship(
@@ -224,6 +522,79 @@ class PasswordReset(db.Model, BaseModel):
         self.token = token
         self.user_id = user_id
 
+    @classmethod
+    def lifetime(cls):
+        return current_app.config['PASSWORD_RESET_EXPIRES']
+
+    def is_expired(self):
+        return self.created_at < self._now() - self.lifetime()
+
+
+class IdempotencyKey(db.Model, BaseModel):
+    """Holds the responses to the requests made with an idempotency key
+    so that retries of a request are answered without repeating it"""
+
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_user_id_key', 'user_id', 'key',
+                 unique=True), )
+    _fields = ['key', 'user_id', 'request', 'digest', 'status', 'response']
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(256))
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    # the method and path of the request
+    request = db.Column(db.String(256))
+    # the sha256 of its body
+    digest = db.Column(db.String(64))
+    status = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, default=db.func.current_timestamp(), index=True)
+
+    @classmethod
+    def find(cls, user_id, key):
+        """The record of a user's key if any, kept until it is pruned"""
+        return cls.query.filter_by(user_id=user_id, key=key).first()
+
+
+class Outbox(db.Model, BaseModel):
+    """Holds the mails waiting to be sent by the mail sender"""
+
+    __tablename__ = 'outbox'
+    # serves the senders looking for the mails due
+    __table_args__ = (
+        db.Index('ix_outbox_sent_at_send_after', 'sent_at', 'send_after'), )
+    _fields = ['subject', 'recipient', 'html']
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(256))
+    recipient = db.Column(db.String(1024))
+    html = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(1024))
+    send_after = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def __init__(self, subject=None, recipient=None, html=None):
+        """Initialize the queued mail"""
+        self.subject = subject
+        self.recipient = recipient
+        self.html = html
+
+    @classmethod
+    def due(cls, max_attempts, limit):
+        """The unsent mails ready to be sent, locked against the senders
+        of the other workers"""
+        return cls.query.filter(
+            cls.sent_at.is_(None),
+            cls.attempts < max_attempts,
+            cls.send_after <= datetime.utcnow()
+        ).order_by(cls.id).limit(limit).with_for_update(
+            skip_locked=True).all()
+
 
 class UserType:
     """Users roles"""
@@ -240,10 +611,15 @@ class User(db.Model, BaseModel):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(256))
-    email = db.Column(db.String(1024), unique=True)
+    email = db.Column(db.String(1024))
     password = db.Column(db.String(256))
-    token = db.Column(db.String(1024))
+    token = db.Column(db.String(1024), index=True)
     role = db.Column(db.Integer, default=UserType.USER)
+    # bumped to invalidate the claims of the tokens issued before
+    token_version = db.Column(db.Integer, default=0, server_default='0')
+    # kept in step with the user's notifications for the unread badge
+    unread_notifications = db.Column(
+        db.Integer, default=0, server_default='0', nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
@@ -262,19 +638,55 @@ class User(db.Model, BaseModel):
         self.username = username
         self.token = token
         if password:
-            self.password = bcrypt.encrypt(password)
+            self.password = hasher.hash(password)
 
     def from_dict(self, data):
         for field in self._fields:
             if field in data:
                 if field == 'password':
-                    self.password = bcrypt.encrypt(data[field])
+                    self.password = hasher.hash(data[field])
+                elif field == 'role' and self.id and data[field] != self.role:
+                    self.role = data[field]
+                    self.token_version = (self.token_version or 0) + 1
                 else:
                     setattr(self, field, data[field])
 
+    def save(self):
+        """Save the user and forget their cached identities, under their
+        previous email as well when it changes"""
+        emails, user_id = self._emails(), self.id
+        super().save()
+        transaction.on_commit(lambda: self._forget_identity(emails, user_id))
+
+    def delete(self):
+        """Delete the user and forget their cached identities"""
+        emails, user_id = self._emails(), self.id
+        super().delete()
+        transaction.on_commit(lambda: self._forget_identity(emails, user_id))
+
+    def _emails(self):
+        """The user's email along with the one it replaces, before the
+        changes are flushed"""
+        previous = inspect(self).attrs.email.history.deleted or ()
+        return {self.email, *previous}
+
+    @staticmethod
+    def _forget_identity(emails, user_id):
+        cache = identity_cache()
+        if cache is not None:
+            for email in emails:
+                cache.invalidate(email)
+        versions = token_versions()
+        if versions is not None:
+            versions.invalidate(user_id)
+
     def validate_password(self, password):
         """Checks the password is correct against the password hash"""
-        return bcrypt.verify(password, self.password)
+        return hasher.verify(password, self.password)
+
+    def password_needs_rehash(self):
+        """Checks if the password was hashed with another cost factor"""
+        return hasher.needs_update(self.password)
 
     def is_admin(self):
         """Checks if current user is a caterer"""
@@ -285,6 +697,9 @@ class User(db.Model, BaseModel):
         return self.role == UserType.SUPER_ADMIN
 
 
+unique_lower(User, 'email')
+searchable(User, 'username', 'email')
+
 
 class Menu(db.Model, BaseModel):
     """Holds the menus"""
@@ -304,46 +719,43 @@ class Menu(db.Model, BaseModel):
         """Initialize the menu"""
         self.name = name
 
+    def save(self):
+        """Save the menu, renaming it on today's menu"""
+        existing = inspect(self).persistent
+        super().save()
+        if existing:
+            _today_menu_changed()
+
+    def delete(self):
+        super().delete()
+        _today_menu_changed()
+
     @classmethod
     def _apply_data_filters(cls, items, filters):
         # first apply default filters
-        dict_items = BaseModel._apply_data_filters(items, filters)
-
-        # compare as dates
-        timestamp = cast(cls.created_at, db.DATE)
+        dict_items = super()._apply_data_filters(items, filters)
 
-        date_filter = None
-        # time specified for menu items
+        # today's menu items by default
+        time = 'today'
         if filters and 'time' in filters:
             time = filters['time']
-            # history menu items...
-            if time == 'history':
-                date_filter = timestamp < date.today()
-
-            # today's menu items...
-            elif time == 'today':
-                date_filter = timestamp == date.today()
-
-            # menu items date specified...
-            elif time != 'all':
-                from app.utils import str_to_date
-                time = str_to_date(time)
-                if time is not None:
-                    date_filter = timestamp == time
-
-        # default is today's
-        else:
-            date_filter = timestamp == date.today()
-
-        # for every menu, feed menu items...
-        for item, dict_item in zip(items, dict_items):
+        date_filter = MenuItem.time_filter(time)
+
+        # menu items of all the menus in one query...
+        menu_items = defaultdict(list)
+        if items:
+            query = MenuItem.query.filter(
+                MenuItem.menu_id.in_([item.id for item in items])
+            ).options(joinedload(MenuItem.meal)).order_by(MenuItem.id)
             if date_filter is not None:
-                menu_items = item.menu_items.filter(date_filter).all()
-            else:
-                menu_items = item.menu_items.all()
+                query = query.filter(date_filter)
+            for menu_item in query:
+                menu_items[menu_item.menu_id].append(menu_item)
 
+        # ...then feed them to their menus
+        for item, dict_item in zip(items, dict_items):
             result = []
-            for menu_item in menu_items:
+            for menu_item in menu_items[item.id]:
                 dict_repr = menu_item.to_dict()
                 del dict_repr['menu']
                 result.append(dict_repr)
@@ -351,17 +763,26 @@ class Menu(db.Model, BaseModel):
         return dict_items
 
 
+unique_lower(Menu, 'name')
+searchable(Menu, 'name')
+
+
 class MenuItem(db.Model, BaseModel):
     """Holds the menu item of the application"""
 
     __tablename__ = 'menu_items'
     _fields = ['menu_id', 'meal_id', 'quantity']
+    _relations = ['meal', 'menu']
+    _eager = ['meal', 'menu']
 
     id = db.Column(db.Integer, primary_key=True)
-    menu_id = db.Column(db.Integer, db.ForeignKey('menus.id', ondelete='CASCADE'))
-    meal_id = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'))
+    menu_id = db.Column(
+        db.Integer, db.ForeignKey('menus.id', ondelete='CASCADE'), index=True)
+    meal_id = db.Column(
+        db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'), index=True)
     quantity = db.Column(db.Integer)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    created_at = db.Column(
+        db.DateTime, default=db.func.current_timestamp(), index=True)
     updated_at = db.Column(
         db.DateTime,
         default=db.func.current_timestamp(),
@@ -381,6 +802,81 @@ class MenuItem(db.Model, BaseModel):
         self.meal_id = meal_id
         self.quantity = quantity
 
+    def save(self):
+        """Save the menu item and update today's menu. Stock changes are
+        patched in while other changes rebuild it."""
+        state = inspect(self)
+        existing = state.persistent
+        stock_only = existing and not any(
+            state.attrs[key].history.has_changes()
+            for key in ['menu_id', 'meal_id'])
+        quantity_changed = existing and \
+            state.attrs['quantity'].history.has_changes()
+        menu_item_id, quantity = self.id, self.quantity
+        super().save()
+
+        # the quantity set replaces what the counters have left
+        from app.stock import stock_counters
+        counters = stock_counters()
+        if counters is not None and quantity_changed:
+            transaction.on_commit(
+                lambda: counters.set(menu_item_id, quantity))
+            if stock_only:
+                return
+
+        snapshot = today_menu()
+        if snapshot is None:
+            return
+        if stock_only:
+            transaction.on_commit(
+                lambda: snapshot.set_quantity(menu_item_id, quantity))
+        else:
+            transaction.on_commit(snapshot.invalidate)
+
+    def delete(self):
+        super().delete()
+        _today_menu_changed()
+
+    @classmethod
+    def take(cls, menu_item_id, quantity):
+        """Take the quantity from the stock of a menu item in a single
+        conditional update so that concurrent orders cannot oversell it,
+        a negative quantity puts it back. Returns the quantity left or
+        None when there is not enough."""
+        table = cls.__table__
+        statement = table.update().where(table.c.id == menu_item_id).values(
+            quantity=table.c.quantity - quantity)
+        if quantity > 0:
+            statement = statement.where(table.c.quantity >= quantity)
+
+        if db.session.bind.dialect.name == 'postgresql':
+            left = db.session.execute(
+                statement.returning(table.c.quantity)).scalar()
+        elif db.session.execute(statement).rowcount:
+            left = cls.stock(menu_item_id)
+        else:
+            left = None
+        if left is None:
+            return None
+
+        # keep a loaded menu item and today's menu in step...
+        menu_item = db.session.identity_map.get(
+            identity_key(cls, menu_item_id))
+        if menu_item is not None:
+            set_committed_value(menu_item, 'quantity', left)
+        snapshot = today_menu()
+        if snapshot is not None:
+            transaction.on_commit(
+                lambda: snapshot.set_quantity(menu_item_id, left))
+        transaction.flush()
+        return left
+
+    @classmethod
+    def stock(cls, menu_item_id):
+        """The quantity of a menu item left in the database"""
+        return db.session.query(cls.quantity).filter(
+            cls.id == menu_item_id).scalar()
+
     def to_dict(self, fields=None):
         dict_repr = super().to_dict(fields=fields)
         dict_repr['meal'] = self.meal.to_dict() if self.meal else {}
@@ -398,38 +894,34 @@ class MenuItem(db.Model, BaseModel):
 
         # search in related
         if 'search' in filters:
-            pattern = '%{}%'.format(filters['search'])
-            query = query.filter(
-                or_(MenuItem.meal.has(Meal.name.ilike(pattern)),
-                    MenuItem.menu.has(Menu.name.ilike(pattern))))
+            matches = cls.matching(filters['search'])
+            if matches is not None:
+                query = query.filter(cls.id.in_(matches))
+            else:
+                pattern = '%{}%'.format(filters['search'])
+                query = query.filter(
+                    or_(MenuItem.meal.has(Meal.name.ilike(pattern)),
+                        MenuItem.menu.has(Menu.name.ilike(pattern))))
 
-        # time specified for orders
+        # time specified...
         if 'time' in filters:
-            time = filters['time']
-            # compare as dates
-            timestamp = cast(cls.created_at, db.DATE)
-
-            # order history...
-            if time == 'history':
-                query = query.filter(timestamp < date.today())
-
-            # today's orders...
-            elif time == 'today':
-                query = query.filter(timestamp == date.today())
-
-            # no filter for all orders...
-            elif time == 'all':
-                pass
-
-            # orders date specified...
-            else:
-                from app.utils import str_to_date
-                time = str_to_date(time)
-                if time:
-                    query = query.filter(timestamp == time)
+            date_filter = cls.time_filter(filters['time'])
+            if date_filter is not None:
+                query = query.filter(date_filter)
 
         return query
 
+    @classmethod
+    def matching(cls, term):
+        """Select of the ids of the menu items whose meal or menu match
+        the term, searched in their own indexes. None when not searchable."""
+        meals, menus = matching(Meal, term), matching(Menu, term)
+        if meals is None or menus is None:
+            return None
+        return db.select([cls.id]).where(or_(
+            cls.meal_id.in_(db.select([meals.c.id])),
+            cls.menu_id.in_(db.select([menus.c.id]))))
+
     @classmethod
     def paginate(cls, filters=None, query=None, name='data'):
         # if user menu items specified by date...
@@ -444,7 +936,7 @@ class Meal(db.Model, BaseModel):
     _fields = ['name', 'cost', 'img_url']
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(256), unique=True)
+    name = db.Column(db.String(256))
     cost = db.Column(db.Float(2))
     img_url = db.Column(db.String(2048))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -459,6 +951,21 @@ class Meal(db.Model, BaseModel):
         self.cost = cost
         self.img_url = img_url
 
+    def save(self):
+        """Save the meal, updating it on today's menu"""
+        existing = inspect(self).persistent
+        super().save()
+        if existing:
+            _today_menu_changed()
+
+    def delete(self):
+        super().delete()
+        _today_menu_changed()
+
+
+unique_lower(Meal, 'name')
+searchable(Meal, 'name')
+
 
 class OrderStatus:
     """Order Status"""
@@ -466,21 +973,28 @@ class OrderStatus:
     ACCEPTED = 2
     REVOKED = 3
 
+    NAMES = {PENDING: 'Pending', ACCEPTED: 'Accepted', REVOKED: 'Revoked'}
+
 
 class Order(db.Model, BaseModel):
     """Holds an order of the application"""
 
     __tablename__ = 'orders'
+    # serves the users' orders newest first
+    __table_args__ = (db.Index('ix_orders_user_id_id', 'user_id', 'id'), )
     _fields = ['quantity', 'menu_item_id', 'user_id', 'status']
+    _relations = ['user', 'menu_item', 'menu_item.meal', 'menu_item.menu']
 
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, default=1)
     status = db.Column(db.Integer, default=OrderStatus.PENDING)
     menu_item_id = db.Column(
-        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'))
+        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'),
+        index=True)
     user_id = db.Column(db.Integer,
                         db.ForeignKey('users.id', ondelete='CASCADE'))
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    created_at = db.Column(
+        db.DateTime, default=db.func.current_timestamp(), index=True)
     updated_at = db.Column(
         db.DateTime,
         default=db.func.current_timestamp(),
@@ -500,38 +1014,26 @@ class Order(db.Model, BaseModel):
 
         # search in related
         if 'search' in filters:
-            pattern = '%{}%'.format(filters['search'])
-            query = query.filter(
-                or_(Order.user.has(User.username.ilike(pattern)),
-                    Order.user.has(User.email.ilike(pattern)),
-                    Order.menu_item.has(MenuItem.menu.has(Menu.name.ilike(pattern))),
-                    Order.menu_item.has(MenuItem.meal.has(Meal.name.ilike(pattern))))
-            )
-
-        # time specified for orders
-        if 'time' in filters:
-            time = filters['time']
-            # compare as dates
-            timestamp = cast(cls.created_at, db.DATE)
-
-            # order history...
-            if time == 'history':
-                query = query.filter(timestamp < date.today())
-
-            # today's orders...
-            elif time == 'today':
-                query = query.filter(timestamp == date.today())
-
-            # no filter for all orders...
-            elif time == 'all':
-                pass
-
-            # orders date specified...
+            users = matching(User, filters['search'])
+            menu_items = MenuItem.matching(filters['search'])
+            if users is not None and menu_items is not None:
+                query = query.filter(
+                    or_(cls.user_id.in_(db.select([users.c.id])),
+                        cls.menu_item_id.in_(menu_items)))
             else:
-                from app.utils import str_to_date
-                time = str_to_date(time)
-                if time:
-                    query = query.filter(timestamp == time)
+                pattern = '%{}%'.format(filters['search'])
+                query = query.filter(
+                    or_(Order.user.has(User.username.ilike(pattern)),
+                        Order.user.has(User.email.ilike(pattern)),
+                        Order.menu_item.has(MenuItem.menu.has(Menu.name.ilike(pattern))),
+                        Order.menu_item.has(MenuItem.meal.has(Meal.name.ilike(pattern))))
+                )
+
+        # time specified...
+        if 'time' in filters:
+            date_filter = cls.time_filter(filters['time'])
+            if date_filter is not None:
+                query = query.filter(date_filter)
 
         return query
 
@@ -545,6 +1047,63 @@ class Order(db.Model, BaseModel):
         query = cls._apply_db_filters(query, filters)
         return super().paginate(filters=filters, query=query, name=name)
 
+    @classmethod
+    def transition(cls, status, menu_item_id=None, time='today'):
+        """Move the pending orders, of a menu item and a day if given, to
+        the status and notify their users. Takes two statements whatever
+        the count of orders. Returns the count moved."""
+        criteria = [cls.status == OrderStatus.PENDING]
+        if menu_item_id:
+            criteria.append(cls.menu_item_id == menu_item_id)
+        time_filter = cls.time_filter(time)
+        if time_filter is not None:
+            criteria.append(time_filter)
+        elif time != 'all':
+            # rather than moving the orders of every day
+            from app.validation.translator import trans
+            raise ValidationException(
+                {'time': [trans('found_in', {':field:': 'time'})]})
+
+        table = cls.__table__
+        update = table.update().where(and_(*criteria)).values(status=status)
+        if db.session.bind.dialect.name == 'postgresql':
+            rows = db.session.execute(
+                update.returning(table.c.id, table.c.user_id)).fetchall()
+            if rows:
+                cls._notify_transition(
+                    status, [cls.id.in_([row[0] for row in rows])])
+            user_ids = {row[1] for row in rows}
+            count = len(rows)
+        else:
+            # the insert holds the write lock until the update is done
+            cls._notify_transition(status, criteria)
+            user_ids = {row[0] for row in db.session.execute(
+                db.select([cls.user_id]).where(and_(*criteria)).distinct())}
+            count = db.session.execute(update).rowcount
+        notify(user_ids)
+        transaction.flush()
+        return count
+
+    @classmethod
+    def _notify_transition(cls, status, criteria):
+        """Insert the notifications of the orders moved to the status from
+        a select of the orders"""
+        order_id = cast(cls.id, db.String)
+        notifications = db.select([
+            cls.user_id,
+            db.literal('Order(#') + order_id + ') status changed',
+            db.literal('Your order (#') + order_id + ') for ' + Meal.name +
+            ' with ' + cast(cls.quantity, db.String) +
+            ' items status has changed to {}.'.format(
+                OrderStatus.NAMES[status])
+        ]).select_from(
+            cls.__table__.join(MenuItem.__table__).join(Meal.__table__)
+        ).where(and_(*criteria))
+        db.session.execute(Notification.__table__.insert().from_select(
+            ['user_id', 'title', 'message'], notifications))
+        Notification.recount(User.id.in_(
+            db.select([cls.user_id]).where(and_(*criteria))))
+
     def __init__(self, menu_item_id=None, user_id=None, quantity=None):
         """Initialize the order"""
         self.user_id = user_id
@@ -556,13 +1115,21 @@ class Notification(db.Model, BaseModel):
     """Notification model"""
 
     __tablename__ = 'notifications'
-    _fields = ['title', 'message', 'user_id']
+    # serves the users' notifications newest first, and the unread ones
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_id', 'user_id', 'id'),
+        db.Index('ix_notifications_unread', 'user_id', 'id',
+                 postgresql_where=db.text('read_at IS NULL'),
+                 sqlite_where=db.text('read_at IS NULL')), )
+    _fields = ['title', 'message', 'user_id', 'read_at']
+    _relations = ['user']
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(256))
     message = db.Column(db.String(2048))
     user_id = db.Column(db.Integer,
                         db.ForeignKey('users.id', ondelete='CASCADE'))
+    read_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
@@ -579,9 +1146,113 @@ class Notification(db.Model, BaseModel):
         query = cls.query
         if user_id:
             query = query.filter(cls.user_id == user_id)
+        # only the unread ones...
+        if filters and filters.get('unread'):
+            query = query.filter(cls.read_at.is_(None))
         query = query.order_by(cls.id.desc())
         return super().paginate(filters=filters, query=query, name=name)
 
+    def save(self):
+        """Save the notification, counting it unread for its user and
+        waking the requests waiting for it once committed"""
+        new = not inspect(self).persistent
+        super().save()
+        if new and self.read_at is None:
+            self.count_unread(self.user_id, 1)
+        if new:
+            notify([self.user_id])
+
+    def delete(self):
+        """Delete the notification, no longer counting it unread"""
+        unread, user_id = self.read_at is None, self.user_id
+        super().delete()
+        if unread:
+            self.count_unread(user_id, -1)
+
+    def from_dict(self, data):
+        # only read() marks it read, keeping the unread count right
+        return super().from_dict(
+            {key: value for key, value in data.items() if key != 'read_at'})
+
+    def read(self):
+        """Mark the notification read, only once when read concurrently.
+        Returns False if it already was."""
+        table = Notification.__table__
+        read = db.session.execute(table.update().where(and_(
+            table.c.id == self.id, table.c.read_at.is_(None)
+        )).values(read_at=db.func.current_timestamp())).rowcount == 1
+        if read:
+            self.count_unread(self.user_id, -1)
+        transaction.flush()
+        db.session.expire(self, ['read_at', 'updated_at'])
+        return read
+
+    @classmethod
+    def read_all(cls, user_id):
+        """Mark all the user's notifications read in one statement.
+        Returns the count marked."""
+        count = cls.query.filter(
+            cls.user_id == user_id, cls.read_at.is_(None)
+        ).update({cls.read_at: db.func.current_timestamp()},
+                 synchronize_session=False)
+        cls.recount(User.id == user_id)
+        return count
+
+    @staticmethod
+    def count_unread(user_id, delta):
+        """Add to the count of a user's unread notifications"""
+        users = User.__table__
+        db.session.execute(users.update().where(users.c.id == user_id).values(
+            unread_notifications=users.c.unread_notifications + delta,
+            updated_at=users.c.updated_at))
+        transaction.flush()
+
+    @classmethod
+    def recount(cls, users):
+        """Count the unread notifications again for the users matching the
+        criterion, as bulk changes are made"""
+        unread = db.select([db.func.count(cls.id)]).where(and_(
+            cls.user_id == User.id, cls.read_at.is_(None))).as_scalar()
+        db.session.execute(User.__table__.update().where(users).values(
+            unread_notifications=unread,
+            updated_at=User.__table__.c.updated_at))
+        transaction.flush()
+
+    @classmethod
+    def unread(cls, user_id):
+        """The count of a user's unread notifications"""
+        return db.session.query(User.unread_notifications).filter(
+            User.id == user_id).scalar() or 0
+
+    @classmethod
+    def newer(cls, user_id, since_id, limit=100):
+        """The user's notifications made after the one with since_id,
+        oldest first"""
+        return cls.query.filter(
+            cls.user_id == user_id, cls.id > since_id
+        ).order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def latest_id(cls, user_id):
+        """The id of the user's latest notification, 0 if none"""
+        return db.session.query(db.func.max(cls.id)).filter(
+            cls.user_id == user_id).scalar() or 0
+
+    @classmethod
+    def delete_many(cls, user_id, ids=None, before=None):
+        """Delete a user's notifications in one statement, only those with
+        the given ids and created before the given day if any. Returns the
+        count deleted."""
+        query = cls.query.filter(cls.user_id == user_id)
+        if ids is not None:
+            query = query.filter(cls.id.in_(ids))
+        if before is not None:
+            start, _ = day_bounds(before)
+            query = query.filter(cls.created_at < start)
+        count = query.delete(synchronize_session=False)
+        cls.recount(User.id == user_id)
+        return count
+
     def __init__(self, title=None, message=None, user_id=None):
         """Initialize the notification"""
         self.title = title
@@ -1,11 +1,15 @@
+from flask import request
 from .base import JsonRequest
+from app.models import PasswordReset
+from app.exceptions import ValidationException
+from app.validation.translator import trans
 
 
 class RegisterRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'email': 'required|email|unique:User,email',
+            'email': 'required|email',
             'password': 'required|string|confirmed|least_string:6',
             'username': 'required|alpha|least_string:3',
         }
@@ -34,6 +38,17 @@ class PasswordResetRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'token': 'required|string|exists:PasswordReset,token',
+            'token': 'required|string',
             'password': 'required|string|confirmed|least_string:6'
         }
+
+    def validate(self):
+        super().validate()
+        reset = PasswordReset.query.filter_by(
+            token=request.json['token']).first()
+        if not reset:
+            raise ValidationException(
+                {'token': [trans('exists', {':field:': 'token'})]})
+        if reset.is_expired():
+            raise ValidationException(
+                {'token': [trans('expired', {':field:': 'token'})]})
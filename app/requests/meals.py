@@ -5,7 +5,7 @@ class PostRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'name': 'required|alpha|unique:Meal,name',
+            'name': 'required|alpha',
             'cost': 'required|positive',
             'img_url': 'url',
         }
@@ -5,7 +5,7 @@ class PostRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'name': 'required|alpha|unique:Menu,name',
+            'name': 'required|alpha',
         }
 
 
@@ -1,5 +1,8 @@
+from flask import request
 from .base import JsonRequest
-from app.utils import current_user
+from app.utils import current_principal, str_to_date
+from app.exceptions import ValidationException
+from app.validation.translator import trans
 
 
 class PostRequest(JsonRequest):
@@ -19,6 +22,54 @@ class PutRequest(JsonRequest):
             'quantity': 'integer|positive',
             'menu_item_id': 'integer|positive|exists:MenuItem,id',
         } 
-        if current_user().is_admin():
+        if current_principal().is_admin():
             rules['status'] = 'integer|found_in:1,2,3'
         return rules
+
+
+class StatusRequest(JsonRequest):
+    @staticmethod
+    def rules():
+        return {
+            'status': 'required|integer|found_in:2,3',
+            'menu_item_id': 'integer|positive|exists:MenuItem,id',
+            'time': 'string',
+        }
+
+    def validate(self):
+        super().validate()
+        # an unknown time would move the orders of every day...
+        time = request.json.get('time')
+        if time is not None and time not in ['today', 'history', 'all'] \
+                and str_to_date(time) is None:
+            raise ValidationException(
+                {'time': [trans('found_in', {':field:': 'time'})]})
+
+
+class CartRequest(JsonRequest):
+    @staticmethod
+    def rules():
+        return {
+            'user_id': 'required|integer|positive|exists:User,id',
+            'items': 'required|array',
+        }
+
+    def validate(self):
+        super().validate()
+        items = request.json['items']
+        if not items:
+            raise ValidationException(
+                {'items': [trans('required', {':field:': 'items'})]})
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValidationException(
+                    {'items': [trans('array', {':field:': 'items'})]})
+            for field in ['menu_item_id', 'quantity']:
+                value = item.get(field)
+                if value is None:
+                    raise ValidationException(
+                        {field: [trans('required', {':field:': field})]})
+                if not isinstance(value, int) or isinstance(value, bool) \
+                        or value <= 0:
+                    raise ValidationException(
+                        {field: [trans('positive', {':field:': field})]})
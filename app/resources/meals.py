@@ -5,6 +5,7 @@ from app.requests.meals import PostRequest, PutRequest
 from app.middlewares.validation import validate
 from app.middlewares.auth import user_auth, admin_auth
 from app.utils import decoded_qs
+from app.exceptions import ValidationException
 
 
 class MealResource(Resource):
@@ -40,26 +41,19 @@ class MealResource(Resource):
                 'message': 'Meal not found',
             }, 404
 
-        # check if another meal exists with new name...
-        if request.json.get('name'):
-            name = request.json['name']
-            new_meal = Meal.query.filter(Meal.name.ilike(name)).first()
-            if new_meal and new_meal.name.lower() == name.lower() and \
-                    new_meal.id != meal_id:
-                return {
-                    'success': False,
-                    'message': 'Validation error.',
-                    'errors': {
-                        'name': ['Meal name must be unique.']
-                    }
-                }, 400
-
         fields = decoded_qs()
         if fields and fields.get('fields') is not None:
             fields = fields.get('fields').split(',')
 
-        # now update...
-        meal.update(request.json)
+        # now update, another meal may have the new name...
+        try:
+            meal.update(request.json)
+        except ValidationException as ex:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': ex.errors
+            }, 400
         return {
             'success': True,
             'message': 'Meal successfully updated.',
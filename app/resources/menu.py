@@ -1,10 +1,12 @@
-from flask import request
+from flask import request, Response
 from app.models import Menu
+from app.snapshot import today_menu
 from flask_restful import Resource
 from app.requests.menu import PostRequest, PutRequest
 from app.middlewares.auth import user_auth, admin_auth
 from app.middlewares.validation import validate
 from app.utils import decoded_qs
+from app.exceptions import ValidationException
 
 
 class MenuResource(Resource):
@@ -32,21 +34,6 @@ class MenuResource(Resource):
     @admin_auth
     @validate(PutRequest)
     def put(self, menu_id):
-
-        # check if another menu exists with new name...
-        if request.json.get('name'):
-            name = request.json['name']
-            menu = Menu.query.filter_by(name=name).first()
-            if menu and menu.name.lower() == name.lower() and \
-                    menu.id != menu_id:
-                return {
-                    'success': False,
-                    'message': 'Validation error.',
-                    'errors': {
-                        'name': ['Menu name must be unique.']
-                    }
-                }, 400
-
         # check exists? ...
         menu = Menu.query.get(menu_id)
         if not menu:
@@ -55,8 +42,15 @@ class MenuResource(Resource):
                 'message': 'Menu not found.',
             }, 404
 
-        # now update...
-        menu.update(request.json)
+        # now update, another menu may have the new name...
+        try:
+            menu.update(request.json)
+        except ValidationException as ex:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': ex.errors
+            }, 400
         return {
             'success': True,
             'message': 'Menu successfully updated.',
@@ -101,3 +95,21 @@ class MenuListResource(Resource):
             'menu': menu.to_dict()
         }, 201
 
+
+class TodayMenuResource(Resource):
+    @user_auth
+    def get(self):
+        menus, version = today_menu().get()
+        etag = '"{}"'.format(version)
+
+        # the client already has this version...
+        if version == request.args.get('version') or \
+                etag == request.headers.get('If-None-Match'):
+            return Response(status=304, headers={'ETag': etag})
+
+        return {
+            'success': True,
+            'message': "Successfully retrieved today's menu.",
+            'version': version,
+            'menus': menus
+        }, 200, {'ETag': etag}
@@ -1,12 +1,10 @@
 from flask import request
-from datetime import date
 from app.models import MenuItem
 from flask_restful import Resource
 from app.requests.menu_items import PostRequest, PutRequest
 from app.middlewares.auth import user_auth, admin_auth
 from app.middlewares.validation import validate
 from app.utils import decoded_qs
-from sqlalchemy import cast, DATE
 
 
 class MenuItemResource(Resource):
@@ -47,8 +45,8 @@ class MenuItemResource(Resource):
         menu_id = request.json.get('menu_id') or menu_item.menu_id
 
         # check if another menu item exists with same values today
-        timestamp = cast(MenuItem.created_at, DATE)
-        existing = MenuItem.query.filter(timestamp == date.today()).filter_by(
+        today = MenuItem.time_filter('today')
+        existing = MenuItem.query.filter(today).filter_by(
             meal_id=meal_id, menu_id=menu_id
         ).first()
         if existing and existing.id != menu_item_id:
@@ -105,8 +103,8 @@ class MenuItemListResource(Resource):
         menu_id = request.json['menu_id']
 
         # check if another menu item exists with same values today
-        timestamp = cast(MenuItem.created_at, DATE)
-        menu_item = MenuItem.query.filter(timestamp == date.today()).filter_by(
+        today = MenuItem.time_filter('today')
+        menu_item = MenuItem.query.filter(today).filter_by(
             meal_id=meal_id, menu_id=menu_id
         ).first()
         if menu_item:
@@ -1,9 +1,17 @@
-from flask import request
+import json
+import time
+from flask import request, current_app, Response, stream_with_context
+from flask_jwt_extended import get_raw_jwt
+from app import db
+from app.cache import revoked_tokens
+from app.hub import notification_hub
 from app.models import Notification
 from flask_restful import Resource
 from app.middlewares.validation import validate
 from app.middlewares.auth import user_auth
-from app.utils import decoded_qs, current_user
+from app.exceptions import ValidationException
+from app.validation.translator import trans
+from app.utils import decoded_qs, current_principal, str_to_date
 
 
 class NotificationResource(Resource):
@@ -17,7 +25,7 @@ class NotificationResource(Resource):
                 'message': 'Notification not found.',
             }, 404
 
-        user = current_user()
+        user = current_principal()
         if notification.user_id != user.id:
             return {
                 'success': False,
@@ -45,7 +53,7 @@ class NotificationResource(Resource):
                 'message': 'Notification not found.',
             }, 404
 
-        user = current_user()
+        user = current_principal()
         if notification.user_id != user.id:
             return {
                 'success': False,
@@ -64,7 +72,7 @@ class NotificationListResource(Resource):
         resp = Notification.paginate(
             name='notifications',
             filters=decoded_qs(),
-            user_id=current_user().id
+            user_id=current_principal().id
         )
         resp['message'] = 'Successfully retrieved notifications.'
         resp['success'] = True
@@ -72,11 +80,165 @@ class NotificationListResource(Resource):
 
     @user_auth
     def delete(self):
-        user = current_user()
-        notifications = Notification.query.filter_by(user_id=user.id).all()
-        for notification in notifications:
-            notification.delete()
+        filters = decoded_qs() or {}
+
+        # only the selected ids...
+        ids = None
+        if 'ids' in filters:
+            try:
+                ids = [int(id) for id in filters['ids'].split(',')]
+            except ValueError:
+                raise ValidationException(
+                    {'ids': [trans('integer', {':field:': 'ids'})]})
+
+        # only those older than a day...
+        before = None
+        if filters.get('before'):
+            before = str_to_date(filters['before'])
+            if before is None:
+                raise ValidationException(
+                    {'before': [trans('date', {':field:': 'before'})]})
+
+        count = Notification.delete_many(
+            current_principal().id, ids=ids, before=before)
+        message = 'Successfully deleted all notifications.'
+        if ids or before:
+            message = 'Successfully deleted {} notification(s).'.format(count)
+        return {
+            'success': True,
+            'message': message,
+            'count': count
+        }
+
+
+class NotificationReadResource(Resource):
+    @user_auth
+    def put(self, notification_id=None):
+        user = current_principal()
+
+        # all of them...
+        if notification_id is None:
+            count = Notification.read_all(user.id)
+            return {
+                'success': True,
+                'message': 'Successfully read {} notification(s).'.format(
+                    count),
+                'count': count
+            }
+
+        # exists? ...
+        notification = Notification.query.get(notification_id)
+        if not notification:
+            return {
+                'success': False,
+                'message': 'Notification not found.',
+            }, 404
+
+        if notification.user_id != user.id:
+            return {
+                'success': False,
+                'message': 'Unauthorized to access this notification.',
+            }, 401
+
+        notification.read()
+        return {
+            'success': True,
+            'message': 'Notification successfully read.',
+            'notification': notification.to_dict()
+        }
+
+
+class NotificationUnreadResource(Resource):
+    @user_auth
+    def get(self):
         return {
             'success': True,
-            'message': 'Successfully deleted all notifications.',
+            'message': 'Successfully retrieved unread notifications count.',
+            'unread': Notification.unread(current_principal().id)
         }
+
+
+class NotificationStreamResource(Resource):
+    """New notifications of the user after since_id, or the Last-Event-ID
+    header, long-polled or streamed as server-sent events. Waiting clients
+    hold no database connection and are woken by the notification hub.
+    Streams end after NOTIFICATION_STREAM_MAX_AGE seconds, or once their
+    token is revoked or expired, for the clients to reconnect."""
+
+    @user_auth
+    def get(self):
+        user_id = current_principal().id
+        filters = decoded_qs() or {}
+        since_id = request.headers.get('Last-Event-ID',
+                                       filters.get('since_id'))
+        if since_id is None:
+            since_id = Notification.latest_id(user_id)
+        try:
+            since_id = int(since_id)
+        except ValueError:
+            raise ValidationException(
+                {'since_id': [trans('integer', {':field:': 'since_id'})]})
+
+        timeout = current_app.config['NOTIFICATION_POLL_TIMEOUT']
+        if request.accept_mimetypes.best == 'text/event-stream':
+            return Response(
+                stream_with_context(self.stream(user_id, since_id, timeout)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache',
+                         'X-Accel-Buffering': 'no'})
+
+        notifications = self.wait(user_id, since_id, timeout)
+        if notifications:
+            since_id = notifications[-1].id
+        return {
+            'success': True,
+            'message': 'Successfully retrieved notifications.',
+            'notifications': [n.to_dict() for n in notifications],
+            'since_id': since_id
+        }
+
+    @classmethod
+    def stream(cls, user_id, since_id, timeout):
+        token = get_raw_jwt()
+        deadline = time.monotonic() + \
+            current_app.config['NOTIFICATION_STREAM_MAX_AGE']
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            notifications = cls.wait(
+                user_id, since_id, min(timeout, remaining))
+            if not cls.authorized(token):
+                return
+            if not notifications:
+                yield ': keep-alive\n\n'
+                continue
+            for notification in notifications:
+                yield 'id: {}\nevent: notification\ndata: {}\n\n'.format(
+                    notification.id, json.dumps(notification.to_dict()))
+            since_id = notifications[-1].id
+
+    @staticmethod
+    def authorized(token):
+        """Whether the token the stream was opened with still holds"""
+        return token['exp'] > time.time() and \
+            not revoked_tokens().is_revoked(token['jti'])
+
+    @staticmethod
+    def wait(user_id, since_id, timeout):
+        """The user's notifications after since_id, waiting up to timeout
+        seconds for some to be made"""
+        hub = notification_hub()
+        hub.listen(current_app._get_current_object())
+        deadline = time.monotonic() + timeout
+        while True:
+            # taken first, so those made while querying wake us up...
+            version = hub.version(user_id)
+            notifications = Notification.newer(user_id, since_id)
+            remaining = deadline - time.monotonic()
+            if notifications or remaining <= 0:
+                return notifications
+            # give the connection back while waiting
+            db.session.close()
+            if not hub.wait(user_id, version, remaining):
+                return []
@@ -1,11 +1,15 @@
 from flask import request
 from datetime import date
 from flask_restful import Resource
+from app import stock, transaction
+from sqlalchemy.orm import joinedload
 from app.models import OrderStatus, Order, MenuItem, Notification
-from app.requests.orders import PostRequest, PutRequest
+from app.requests.orders import (PostRequest, PutRequest, CartRequest,
+                                 StatusRequest)
 from app.middlewares.auth import user_auth, admin_auth
-from app.utils import current_user
+from app.utils import current_principal
 from app.middlewares.validation import validate
+from app.middlewares.idempotency import idempotent
 from app.utils import decoded_qs
 
 
@@ -31,6 +35,7 @@ class OrderResource(Resource):
         }
 
     @user_auth
+    @idempotent
     @validate(PutRequest)
     def put(self, order_id):
 
@@ -43,7 +48,7 @@ class OrderResource(Resource):
             }, 404
 
         # check user is authorized to update order
-        user = current_user()
+        user = current_principal()
         if not user.is_admin() and user.id != order.user_id:
             return {
                 'success': False,
@@ -51,14 +56,22 @@ class OrderResource(Resource):
             }, 401
 
         if request.json.get('quantity'):
-            # check that we have enough quantity...
-            menu_item = MenuItem.query.get(request.json['menu_item_id'])
-            available = order.quantity + menu_item.quantity
-            if available < request.json['quantity']:
+            # take the new quantity, giving back the ordered one...
+            menu_item_id = request.json.get('menu_item_id', order.menu_item_id)
+            if menu_item_id == order.menu_item_id:
+                left = stock.take(
+                    menu_item_id, request.json['quantity'] - order.quantity)
+            else:
+                left = stock.take(menu_item_id, request.json['quantity'])
+                if left is not None:
+                    stock.take(order.menu_item_id, -order.quantity)
+
+            if left is None:
+                left = stock.left(menu_item_id)
                 message = None
-                if menu_item.quantity > 0:
+                if left > 0:
                     message = 'Only {} more meals are available.'.format(
-                        menu_item.quantity)
+                        left)
                 else:
                     message = 'No more orders can be made on this meal.'
                 return {
@@ -69,11 +82,6 @@ class OrderResource(Resource):
                     }
                 }, 400
 
-            # set the new quantity...
-            menu_item.quantity = (
-                menu_item.quantity - request.json['quantity'] + order.quantity)
-            menu_item.save()
-
         # save status for comparison
         order_status = order.status
 
@@ -129,7 +137,7 @@ class OrderResource(Resource):
             }, 404
 
         # check user can delete this order...
-        user = current_user()
+        user = current_principal()
         if not user.is_admin() and user.id != order.user_id:
             return {
                 'success': False,
@@ -137,9 +145,7 @@ class OrderResource(Resource):
             }, 401
 
         # restore quantity...
-        menu_item = MenuItem.query.get(order.menu_item_id)
-        menu_item.quantity += order.quantity
-        menu_item.save()
+        stock.take(order.menu_item_id, -order.quantity)
 
         # now delete...
         order.delete()
@@ -166,7 +172,7 @@ class OrderListResource(Resource):
     def get(self):
 
         # user should see his/her orders only...
-        user = current_user()
+        user = current_principal()
         if user.is_admin():
             user_id = None
         else:
@@ -179,23 +185,24 @@ class OrderListResource(Resource):
         return resp
 
     @user_auth
+    @idempotent
     @validate(PostRequest)
     def post(self):
 
-        user = current_user()
+        user = current_principal()
         if not user.is_admin() and user.id != request.json['user_id']:
             return {
                 'success': False,
                 'message': 'Unauthorized to create this order.'
             }, 401
 
-        # check we have enough quantity...
-        menu_item = MenuItem.query.get(request.json['menu_item_id'])
-        if menu_item.quantity < request.json['quantity']:
+        # take the quantity if we have enough...
+        menu_item_id = request.json['menu_item_id']
+        if stock.take(menu_item_id, request.json['quantity']) is None:
+            left = stock.left(menu_item_id)
             message = None
-            if menu_item.quantity > 0:
-                message = 'Only {} meal(s) are available.'.format(
-                    menu_item.quantity)
+            if left > 0:
+                message = 'Only {} meal(s) are available.'.format(left)
             else:
                 message = 'No more orders can be made on this meal.'
 
@@ -207,10 +214,6 @@ class OrderListResource(Resource):
                 }
             }, 400
 
-        # update quantity...
-        menu_item.quantity -= request.json['quantity']
-        menu_item.save()
-
         # create order...
         order = Order.create(request.json)
 
@@ -230,3 +233,111 @@ class OrderListResource(Resource):
             'message': 'Successfully saved order.',
             'order': order.to_dict()
         }, 201
+
+
+class OrderCartResource(Resource):
+    @user_auth
+    @idempotent
+    @validate(CartRequest)
+    def post(self):
+
+        user = current_principal()
+        if not user.is_admin() and user.id != request.json['user_id']:
+            return {
+                'success': False,
+                'message': 'Unauthorized to create this order.'
+            }, 401
+
+        # the quantity of each menu item in the cart...
+        quantities = {}
+        for item in request.json['items']:
+            menu_item_id = item['menu_item_id']
+            quantities[menu_item_id] = (
+                quantities.get(menu_item_id, 0) + item['quantity'])
+
+        # check the menu items exist...
+        menu_items = {
+            menu_item.id: menu_item for menu_item in MenuItem.query.filter(
+                MenuItem.id.in_(quantities)).options(
+                    joinedload(MenuItem.meal))
+        }
+        missing = [id for id in quantities if id not in menu_items]
+        if missing:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'menu_item_id': [
+                        'The selected menu item id {} is invalid.'.format(
+                            ', '.join(str(id) for id in missing))]
+                }
+            }, 400
+
+        # take every quantity, in the order of the ids so that concurrent
+        # carts lock the rows alike. A failure rolls back them all.
+        taken = []
+        for menu_item_id in sorted(quantities):
+            if stock.take(menu_item_id, quantities[menu_item_id]) is None:
+                # ...unless each was committed as it was taken
+                if not transaction.in_request():
+                    for id in taken:
+                        stock.take(id, -quantities[id])
+                left = stock.left(menu_item_id)
+                name = menu_items[menu_item_id].meal.name
+                message = None
+                if left > 0:
+                    message = 'Only {} {} meal(s) are available.'.format(
+                        left, name)
+                else:
+                    message = 'No more orders can be made on {}.'.format(
+                        name)
+                return {
+                    'success': False,
+                    'message': 'Validation error.',
+                    'errors': {
+                        'quantity': [message]
+                    }
+                }, 400
+            taken.append(menu_item_id)
+
+        # create the orders...
+        orders = Order.create_many([{
+            'user_id': request.json['user_id'],
+            'menu_item_id': menu_item_id,
+            'quantity': quantity,
+        } for menu_item_id, quantity in quantities.items()])
+
+        message = """Your orders {} were successfully received.""".format(
+            ', '.join('(#{}) for {} with {} items'.format(
+                order.id, menu_items[order.menu_item_id].meal.name,
+                order.quantity) for order in orders))
+
+        # save one notification for them all
+        Notification.create({
+            'user_id': user.id,
+            'title': 'Order({}) recieved'.format(
+                ', '.join('#{}'.format(order.id) for order in orders)),
+            'message': message
+        })
+
+        return {
+            'success': True,
+            'message': 'Successfully saved orders.',
+            'orders': [order.to_dict() for order in orders]
+        }, 201
+
+
+class OrderStatusResource(Resource):
+    @admin_auth
+    @validate(StatusRequest)
+    def put(self):
+        # move the pending orders all at once...
+        count = Order.transition(
+            request.json['status'],
+            menu_item_id=request.json.get('menu_item_id'),
+            time=request.json.get('time', 'today'))
+        return {
+            'success': True,
+            'message': 'Successfully updated {} order(s).'.format(count),
+            'count': count
+        }
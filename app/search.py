@@ -0,0 +1,125 @@
+"""Full-text search of the models' text columns, through a GIN index of
+their tsvector on Postgres and an FTS5 table kept by triggers on SQLite"""
+
+import re
+from sqlalchemy import event, DDL
+from app import db
+
+# the searchable text columns by table
+_columns = {}
+
+# finds a search index by name
+CATALOGS = {
+    'postgresql': 'SELECT 1 FROM pg_indexes WHERE indexname = :name',
+    'sqlite': "SELECT 1 FROM sqlite_master "
+              "WHERE type = 'table' AND name = :name",
+}
+
+
+def searchable(model, *columns):
+    """Index the text columns of the model for search, along with its
+    table when it is created"""
+    table = model.__table__
+    _columns[table.name] = columns
+    for dialect, statements in _statements(table.name, columns).items():
+        for statement in statements:
+            event.listen(table, 'after_create',
+                         DDL(statement).execute_if(dialect=dialect))
+    event.listen(table, 'before_drop', DDL(
+        'DROP TABLE IF EXISTS {}_search'.format(table.name)
+    ).execute_if(dialect='sqlite'))
+
+
+def matching(model, term):
+    """Alias of a select of the ids of the model's rows matching every word
+    of the term as a prefix, and their rank, higher the better. None when
+    the model or the database is not searchable or the term has no words."""
+    columns = _columns.get(model.__tablename__)
+    words = re.findall(r'\w+', term)
+    if not columns or not words:
+        return None
+
+    dialect = db.session.bind.dialect.name
+    if dialect == 'postgresql':
+        document = db.literal_column(_document(columns))
+        query = db.func.to_tsquery(
+            'simple', ' & '.join(word + ':*' for word in words))
+        return db.select([
+            model.id.label('id'),
+            db.func.ts_rank(document, query).label('rank')
+        ]).where(document.op('@@')(query)).alias()
+
+    if dialect == 'sqlite':
+        name = model.__tablename__ + '_search'
+        index = db.table(name, db.column('rowid'))
+        return db.select([
+            index.c.rowid.label('id'),
+            (-db.func.bm25(db.literal_column(name))).label('rank')
+        ]).where(db.literal_column(name).op('MATCH')(
+            ' '.join('"{}"*'.format(word) for word in words))).alias()
+    return None
+
+
+def create_indexes(connection, concurrently=False):
+    """Create the missing search indexes of the models on a live database,
+    filling them on SQLite. Returns their names."""
+    dialect = connection.dialect.name
+    created = []
+    for table, columns in sorted(_columns.items()):
+        statements = _statements(table, columns).get(dialect)
+        name = _index_name(table, dialect)
+        if not statements or connection.execute(
+                CATALOGS[dialect], {'name': name}).scalar():
+            continue
+        if concurrently:
+            statements = [statement.replace(
+                'CREATE INDEX', 'CREATE INDEX CONCURRENTLY')
+                for statement in statements]
+        for statement in statements:
+            connection.execute(statement)
+        if dialect == 'sqlite':
+            connection.execute(
+                "INSERT INTO {0}({0}) VALUES ('rebuild')".format(name))
+        created.append(name)
+    return created
+
+
+def _index_name(table, dialect):
+    if dialect == 'sqlite':
+        return table + '_search'
+    return 'ix_{}_search'.format(table)
+
+
+def _document(columns):
+    """The tsvector of the columns, the same for the index and the queries
+    for Postgres to use the index"""
+    return "to_tsvector('simple', {})".format(" || ' ' || ".join(
+        "coalesce({}, '')".format(column) for column in columns))
+
+
+def _statements(table, columns):
+    """The statements creating the search index of a table by dialect"""
+    names = ', '.join(columns)
+    new = ', '.join('new.' + column for column in columns)
+    old = ', '.join('old.' + column for column in columns)
+    insert = ('INSERT INTO {0}_search(rowid, {1}) '
+              'VALUES (new.id, {2});').format(table, names, new)
+    delete = ("INSERT INTO {0}_search({0}_search, rowid, {1}) "
+              "VALUES ('delete', old.id, {2});").format(table, names, old)
+    return {
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS ix_{0}_search ON {0} '
+            'USING gin (({1}))'.format(table, _document(columns)),
+        ],
+        'sqlite': [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {0}_search USING "
+            "fts5({1}, content='{0}', content_rowid='id')".format(
+                table, names),
+            'CREATE TRIGGER IF NOT EXISTS {0}_search_insert AFTER INSERT '
+            'ON {0} BEGIN {1} END'.format(table, insert),
+            'CREATE TRIGGER IF NOT EXISTS {0}_search_delete AFTER DELETE '
+            'ON {0} BEGIN {1} END'.format(table, delete),
+            'CREATE TRIGGER IF NOT EXISTS {0}_search_update AFTER UPDATE '
+            'ON {0} BEGIN {1} {2} END'.format(table, delete, insert),
+        ],
+    }
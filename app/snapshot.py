@@ -0,0 +1,110 @@
+"""Today's menu kept in memory for the clients polling it"""
+
+import json
+import time
+import hashlib
+from threading import Lock
+from flask import current_app, has_app_context
+
+
+class TodayMenu:
+    """Snapshot of today's menus with their meals, costs and remaining
+    quantities. Stock changes made through this worker are patched in
+    place while other changes rebuild it on the next read. Changes made
+    through other workers are picked up after `max_age` seconds.
+
+    The version is derived from the content, so it is the same across
+    workers holding the same snapshot."""
+
+    def __init__(self, max_age=5):
+        self.max_age = max_age
+        self._menus = None
+        self._version = None
+        self._day = None
+        self._built_at = None
+        self._lock = Lock()
+
+    def get(self):
+        """Returns today's menus and their version"""
+        with self._lock:
+            if self._is_stale():
+                self._build()
+            if self._version is None:
+                self._version = self._hash(self._menus)
+            return self._menus, self._version
+
+    def set_quantity(self, menu_item_id, quantity):
+        """Patch the remaining quantity of a menu item"""
+        with self._lock:
+            if self._menus is None:
+                return
+            for menu in self._menus:
+                for menu_item in menu['menu_items']:
+                    if menu_item['id'] == menu_item_id:
+                        menu_item['quantity'] = quantity
+                        self._version = None
+                        return
+
+    def invalidate(self):
+        with self._lock:
+            self._menus = None
+            self._version = None
+
+    def _is_stale(self):
+        from app.models import today
+        return self._menus is None or self._day != today() or \
+            time.monotonic() - self._built_at >= self.max_age
+
+    def _build(self):
+        from app.models import MenuItem, today
+        from sqlalchemy.orm import joinedload
+
+        day = today()
+        menu_items = MenuItem.query.filter(
+            MenuItem.time_filter('today')
+        ).options(
+            joinedload(MenuItem.meal), joinedload(MenuItem.menu)
+        ).order_by(MenuItem.id)
+
+        # group the menu items by their menus...
+        menus = {}
+        for menu_item in menu_items:
+            if menu_item.menu is None or menu_item.meal is None:
+                continue
+            menu = menus.setdefault(menu_item.menu_id, {
+                'id': menu_item.menu.id,
+                'name': menu_item.menu.name,
+                'menu_items': []
+            })
+            menu['menu_items'].append({
+                'id': menu_item.id,
+                'quantity': menu_item.quantity,
+                'meal': {
+                    'id': menu_item.meal.id,
+                    'name': menu_item.meal.name,
+                    'cost': menu_item.meal.cost,
+                    'img_url': menu_item.meal.img_url,
+                }
+            })
+
+        self._menus = sorted(menus.values(), key=lambda menu: menu['id'])
+        self._version = None
+        self._day = day
+        self._built_at = time.monotonic()
+
+    @staticmethod
+    def _hash(menus):
+        content = json.dumps(menus, sort_keys=True).encode()
+        return hashlib.sha1(content).hexdigest()[:16]
+
+
+def init_app(app):
+    app.extensions['today_menu'] = TodayMenu(
+        max_age=app.config.get('TODAY_MENU_MAX_AGE', 5))
+
+
+def today_menu():
+    """Returns today's menu snapshot of the current application if any"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('today_menu')
@@ -0,0 +1,350 @@
+"""Menu item quantities shared by the workers of a node"""
+
+import os
+import mmap
+import time
+import fcntl
+import random
+import struct
+import logging
+from threading import Lock, RLock, Thread
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+from app import db, transaction
+from app.models import MenuItem
+from app.snapshot import today_menu
+
+# the id of the server that loaded the counters and the slots' layout
+HEADER = struct.Struct('qq')
+LAYOUT = 2
+# the environment variable holding the id of the server, set by its master
+# process for the workers it forks to share
+SERVER_ID = 'STOCK_SERVER_ID'
+# menu item id, quantity left, quantity taken and not yet written to the
+# database, quantity being written, and the generation of the quantity
+# bumped as it is set by an admin
+SLOT = struct.Struct('qqqqq')
+
+
+class StockCounters:
+    """Quantities of the menu items being ordered, kept in a memory-mapped
+    file shared by the workers of a node. Orders take their quantity here
+    under a lock of the menu item's slot instead of the database row, and
+    the quantities taken are written to the database in batches by
+    `flush`. The counters are reconciled with the database when they are
+    opened by the workers of a restarted server, those given another
+    `server` id, and never by the other processes. A quantity set by an
+    admin replaces what is left, and what was taken before it is no longer
+    written.
+
+    Only the workers of one node must take orders while these are on."""
+
+    def __init__(self, path, size=1024, server=None):
+        self.path = path
+        self.size = size
+        self.server = server
+        self._fd = None
+        self._map = None
+        # lockf locks are held by the process, so its threads take turns
+        self._lock = RLock()
+        self._flush_lock = Lock()
+
+    def take(self, menu_item_id, quantity):
+        """Take the quantity of a menu item, a negative quantity puts it
+        back. The quantity is written to the database once the request
+        commits and put back if it rolls back. Returns the quantity left
+        or None when there is not enough."""
+        offset = self._slot(menu_item_id)
+        if offset is None:
+            # the counters are full...
+            return MenuItem.take(menu_item_id, quantity)
+
+        with self._locked(offset):
+            _, left, pending, flushing, generation = SLOT.unpack_from(
+                self._map, offset)
+            if quantity > left:
+                return None
+            left -= quantity
+            SLOT.pack_into(self._map, offset, menu_item_id, left, pending,
+                           flushing, generation)
+
+        transaction.on_commit(
+            lambda: self._taken(offset, generation, quantity))
+        transaction.on_rollback(
+            lambda: self._taken(offset, generation, 0, quantity))
+        snapshot = today_menu()
+        if snapshot is not None:
+            transaction.on_commit(
+                lambda: snapshot.set_quantity(menu_item_id, left))
+        return left
+
+    def left(self, menu_item_id):
+        """The quantity of a menu item left"""
+        offset = self._slot(menu_item_id)
+        if offset is None:
+            return MenuItem.stock(menu_item_id)
+        with self._locked(offset):
+            return SLOT.unpack_from(self._map, offset)[1]
+
+    def set(self, menu_item_id, quantity):
+        """Set the quantity left of a menu item, as written to the database
+        by an admin. What was taken before and not yet written is dropped,
+        and the quantity is written again in case a flush ran over it."""
+        offset = self._find(menu_item_id)
+        if offset is not None:
+            with self._flushing():
+                with self._locked(offset):
+                    generation = SLOT.unpack_from(self._map, offset)[4]
+                    SLOT.pack_into(self._map, offset, menu_item_id,
+                                   quantity, 0, 0, generation + 1)
+                    self._write({offset: quantity}, absolute=True)
+
+        snapshot = today_menu()
+        if snapshot is not None:
+            snapshot.set_quantity(menu_item_id, quantity)
+
+    def flush(self):
+        """Write the quantities taken to the database in one transaction.
+        Returns the count of menu items written."""
+        self._open()
+        with self._flushing():
+            taken = {}
+            for offset in self._offsets():
+                with self._locked(offset):
+                    slot = list(SLOT.unpack_from(self._map, offset))
+                    if slot[2]:
+                        taken[offset] = slot[2]
+                        slot[3] += slot[2]
+                        slot[2] = 0
+                        SLOT.pack_into(self._map, offset, *slot)
+            if not taken:
+                return 0
+
+            try:
+                self._write(taken)
+            except Exception:
+                # take them again on the next flush...
+                for offset, quantity in taken.items():
+                    self._flushed(offset, quantity, failed=True)
+                raise
+            for offset, quantity in taken.items():
+                self._flushed(offset, quantity)
+            return len(taken)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+            self._map = self._fd = None
+
+    def _open(self):
+        with self._lock:
+            if self._map is not None:
+                return
+            length = self._length()
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+            self._fd = fd
+            self._map = mmap.mmap(fd, length)
+            if self.server is not None:
+                self._reconcile()
+
+    def _reconcile(self):
+        """Write what the previous server took to the database and start
+        over from the database's quantities, with the flushes and every
+        slot locked out"""
+        with self._flushing():
+            with self._locked(0, self._length()):
+                server, layout = HEADER.unpack_from(self._map, 0)
+                if server == self.server and layout == LAYOUT:
+                    return
+                if layout == LAYOUT:
+                    taken = {}
+                    for offset in self._offsets():
+                        _, _, pending, flushing, _ = SLOT.unpack_from(
+                            self._map, offset)
+                        if pending + flushing:
+                            taken[offset] = pending + flushing
+                    self._write(taken)
+                elif server:
+                    logging.warning(
+                        'stock: dropping counters of another layout')
+                self._map[HEADER.size:] = bytes(
+                    len(self._map) - HEADER.size)
+                HEADER.pack_into(self._map, 0, self.server, LAYOUT)
+
+    def _write(self, quantities, absolute=False):
+        """Write the quantities taken from the menu items of the slots, or
+        their quantities when absolute"""
+        table = MenuItem.__table__
+        with db.engine.begin() as connection:
+            for offset, quantity in quantities.items():
+                menu_item_id = SLOT.unpack_from(self._map, offset)[0]
+                if not absolute:
+                    quantity = table.c.quantity - quantity
+                connection.execute(
+                    table.update().where(table.c.id == menu_item_id).values(
+                        quantity=quantity))
+
+    def _taken(self, offset, generation, pending, left=0):
+        with self._locked(offset):
+            slot = list(SLOT.unpack_from(self._map, offset))
+            # taken from a quantity since replaced...
+            if slot[4] != generation:
+                return
+            slot[1] += left
+            slot[2] += pending
+            SLOT.pack_into(self._map, offset, *slot)
+
+    def _flushed(self, offset, quantity, failed=False):
+        with self._locked(offset):
+            slot = list(SLOT.unpack_from(self._map, offset))
+            slot[3] -= quantity
+            if failed:
+                slot[2] += quantity
+            SLOT.pack_into(self._map, offset, *slot)
+
+    def _length(self):
+        return HEADER.size + SLOT.size * self.size
+
+    def _slot(self, menu_item_id):
+        """The offset of the menu item's slot, loaded from the database
+        the first time. None when there is no slot left."""
+        offset = self._find(menu_item_id)
+        if offset is not None:
+            return offset
+
+        with self._locked(0, HEADER.size):
+            for offset in self._probe(menu_item_id):
+                slot_id = SLOT.unpack_from(self._map, offset)[0]
+                if slot_id == menu_item_id:
+                    return offset
+                if slot_id == 0:
+                    with self._locked(offset):
+                        SLOT.pack_into(self._map, offset, menu_item_id,
+                                       self._stock(menu_item_id), 0, 0, 0)
+                    return offset
+        return None
+
+    def _find(self, menu_item_id):
+        self._open()
+        for offset in self._probe(menu_item_id):
+            slot_id = SLOT.unpack_from(self._map, offset)[0]
+            if slot_id == menu_item_id:
+                return offset
+            if slot_id == 0:
+                return None
+        return None
+
+    def _probe(self, menu_item_id):
+        start = menu_item_id % self.size
+        for i in range(self.size):
+            yield HEADER.size + SLOT.size * ((start + i) % self.size)
+
+    def _offsets(self):
+        for i in range(self.size):
+            offset = HEADER.size + SLOT.size * i
+            if SLOT.unpack_from(self._map, offset)[0]:
+                yield offset
+
+    @staticmethod
+    def _stock(menu_item_id):
+        table = MenuItem.__table__
+        with db.engine.connect() as connection:
+            return connection.execute(
+                db.select([table.c.quantity]).where(
+                    table.c.id == menu_item_id)).scalar() or 0
+
+    @contextmanager
+    def _flushing(self):
+        """Lock out the other flushes and quantities being set, on a byte
+        past the slots"""
+        with self._flush_lock:
+            offset = self._length()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+    @contextmanager
+    def _locked(self, offset, length=SLOT.size):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+
+def init_app(app):
+    """Set up the stock counters if a file is configured"""
+    path = app.config.get('STOCK_COUNTERS')
+    if not path:
+        app.extensions['stock_counters'] = None
+        return
+    app.extensions['stock_counters'] = StockCounters(
+        path, size=app.config['STOCK_COUNTERS_SIZE'])
+
+
+def boot():
+    """Give the server an id, in its master process before the workers
+    are forked. Returns the id."""
+    return int(os.environ.setdefault(
+        SERVER_ID, str(random.randrange(1, 2 ** 63))))
+
+
+def serve(app):
+    """Reconcile the stock counters of the server with the database and
+    start writing them to it. Called by the workers serving the requests
+    only, never by the commands and other processes sharing the
+    configuration."""
+    counters = app.extensions.get('stock_counters')
+    if counters is None or counters.server is not None:
+        return
+    counters.close()
+    counters.server = boot()
+    with app.app_context():
+        counters._open()
+
+    interval = app.config.get('STOCK_FLUSH_INTERVAL')
+    if not interval:
+        return
+
+    def flush():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    counters.flush()
+                except Exception:
+                    logging.exception('stock: writing the counters failed')
+
+    Thread(target=flush, name='stock-flusher', daemon=True).start()
+
+
+def stock_counters():
+    """Returns the stock counters of the current application if any"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('stock_counters')
+
+
+def take(menu_item_id, quantity):
+    """Take the quantity of a menu item through the stock counters when
+    they are on, from the database otherwise. Returns the quantity left
+    or None when there is not enough."""
+    counters = stock_counters()
+    if counters is None:
+        return MenuItem.take(menu_item_id, quantity)
+    return counters.take(menu_item_id, quantity)
+
+
+def left(menu_item_id):
+    """The quantity of a menu item left"""
+    counters = stock_counters()
+    if counters is None:
+        return MenuItem.stock(menu_item_id)
+    return counters.left(menu_item_id)
@@ -0,0 +1,40 @@
+"""Removes expired revoked tokens, password resets and idempotency
+keys"""
+
+import time
+import logging
+from threading import Thread
+from flask import current_app
+from app.models import Blacklist, PasswordReset, IdempotencyKey
+
+
+def prune(batch_size=None):
+    """Delete the expired blacklist, password reset and idempotency key
+    records. Returns the counts deleted from each."""
+    config = current_app.config
+    batch_size = batch_size or config['PRUNE_BATCH_SIZE']
+    blacklist = Blacklist.prune(
+        config['JWT_ACCESS_TOKEN_EXPIRES'], batch_size=batch_size)
+    resets = PasswordReset.prune(
+        config['PASSWORD_RESET_EXPIRES'], batch_size=batch_size)
+    keys = IdempotencyKey.prune(
+        config['IDEMPOTENCY_KEY_EXPIRES'], batch_size=batch_size)
+    return blacklist, resets, keys
+
+
+def init_app(app):
+    """Start the background sweeper if an interval is configured"""
+    interval = app.config.get('PRUNE_INTERVAL')
+    if not interval:
+        return
+
+    def sweep():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    prune()
+                except Exception:
+                    logging.exception('sweeper: prune failed')
+
+    Thread(target=sweep, name='sweeper', daemon=True).start()
@@ -0,0 +1,83 @@
+"""One transaction per request. The models only flush their changes
+within a request, which are committed once when it succeeds and rolled
+back when it fails."""
+
+from flask import g, has_request_context
+from app import db
+
+
+def in_request():
+    """Checks if the changes are left for the request to commit"""
+    return has_request_context() and g.get('on_commit') is not None
+
+
+def flush():
+    """Flush the changes within a request, commit them otherwise"""
+    if in_request():
+        db.session.flush()
+    else:
+        commit()
+
+
+def commit():
+    """Commit the changes now and run the callbacks waiting for them"""
+    db.session.commit()
+    if in_request():
+        callbacks, g.on_commit, g.on_rollback = g.on_commit, [], []
+        for callback in callbacks:
+            callback()
+
+
+def rollback():
+    """Roll the changes back and run the callbacks undoing them"""
+    db.session.rollback()
+    if in_request():
+        callbacks, g.on_commit, g.on_rollback = g.on_rollback, [], []
+        for callback in callbacks:
+            callback()
+
+
+def on_commit(callback):
+    """Run the callback once the changes are committed, right away when
+    they are not left for the request to commit"""
+    if in_request():
+        g.on_commit.append(callback)
+    else:
+        callback()
+
+
+def on_rollback(callback):
+    """Run the callback if the changes are rolled back, never when they
+    are not left for the request to commit"""
+    if in_request():
+        g.on_rollback.append(callback)
+
+
+def init_app(app):
+    if not app.config.get('UNIT_OF_WORK'):
+        return
+
+    @app.before_request
+    def begin():
+        g.on_commit = []
+        g.on_rollback = []
+
+    @app.after_request
+    def end(response):
+        if not in_request():
+            return response
+        if response.status_code >= 400:
+            rollback()
+            return response
+        try:
+            commit()
+        except Exception:
+            rollback()
+            raise
+        return response
+
+    @app.teardown_request
+    def discard(ex):
+        # the request failed before it could be committed...
+        if in_request() and (g.on_commit or g.on_rollback):
+            rollback()
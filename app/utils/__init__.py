@@ -2,18 +2,93 @@ import string
 import random
 from datetime import date
 from urllib import parse
-from flask import request
-from app.models import User
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import request, g
+from app import db
+from app.models import User, UserType
+from app.cache import identity_cache, token_versions
+from flask_jwt_extended import (jwt_required, get_jwt_identity,
+                                get_jwt_claims)
+
+
+class Principal:
+    """The authenticated user as described by the JWT claims. Use
+    `load()` when the full user model is required."""
+
+    def __init__(self, id=None, email=None, role=None):
+        self.id = id
+        self.email = email
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, email=user.email, role=user.role)
+
+    def load(self):
+        return current_user()
+
+    def is_admin(self):
+        return self.role in [UserType.ADMIN, UserType.SUPER_ADMIN]
+
+    def is_super_admin(self):
+        return self.role == UserType.SUPER_ADMIN
 
 
 def current_user():
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
-        raise Exception('Authentication: current user not found')
+    # already loaded during this request...
+    if 'current_user' in g:
+        return g.current_user
+
+    identity = get_jwt_identity()
+    cache = identity_cache()
+
+    # loaded by an earlier request...
+    attributes = cache.get(identity) if cache is not None else None
+    if attributes is not None:
+        user = User.from_cache(attributes)
+    else:
+        user = User.query.filter_by(email=identity).first()
+        if not user:
+            raise Exception('Authentication: current user not found')
+        if cache is not None:
+            cache.set(identity, user.to_cache())
+
+    g.current_user = user
     return user
 
 
+def current_principal():
+    # already resolved during this request...
+    if 'current_principal' in g:
+        return g.current_principal
+
+    claims = get_jwt_claims()
+    user_id = claims.get('user_id')
+    if user_id and claims.get('version') == token_version(user_id):
+        principal = Principal(
+            id=user_id, email=get_jwt_identity(), role=claims.get('role'))
+    # older tokens or the user's role has changed since...
+    else:
+        principal = Principal.from_user(current_user())
+
+    g.current_principal = principal
+    return principal
+
+
+def token_version(user_id):
+    versions = token_versions()
+    version = versions.get(user_id) if versions is not None else None
+    if version is None:
+        row = db.session.query(User.token_version).filter_by(
+            id=user_id).first()
+        if row is None:
+            return None
+        # versions left NULL by older rows are those the tokens carry as 0
+        version = row[0] or 0
+        if versions is not None:
+            versions.set(user_id, version)
+    return version
+
+
 def decoded_qs():
     query = {}
     for key, value in request.args.to_dict().items():
@@ -19,6 +19,7 @@ messages = {
     'digits': 'The :field: must be :length: digits.',
     'email': 'The :field: must be a valid email address.',
     'exists': 'The selected :field: is invalid.',
+    'expired': 'The :field: has expired.',
     'found_in': 'The selected :field: is invalid.',
     'integer': 'The :field: must be an integer.',
     'json': 'The :field: must be valid json format.',
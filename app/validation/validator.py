@@ -1,6 +1,7 @@
 import re
 import json
 from datetime import date
+from app import db
 from .translator import trans
 from app.models import (User, Meal, Menu, MenuItem, Order, Notification,
                         PasswordReset)
@@ -103,6 +104,11 @@ class Validator:
             return (False, trans('alpha_num', {':field:': field}))
         return True, ''
 
+    def _array(self, field=None, **kwargs):
+        if not isinstance(self._request[field], list):
+            return (False, trans('array', {':field:': field}))
+        return (True, '')
+
     def _before(self, field=None, params=None, **kwargs):
         field_date = self.__to_date(self._request[field])
         if not field_date:
@@ -361,7 +367,8 @@ class Validator:
     def _unique(self, field=None, params=None, **kwargs):
         modelName, column = params.split(',')
         model = eval(modelName)
-        predicate = getattr(model, column).ilike(self._request[field])
+        predicate = db.func.lower(getattr(model, column)) == \
+            db.func.lower(self._request[field])
         if model.query.filter(predicate).first():
             return (False, trans('unique', {':field:': field}))
         return (True, '')
@@ -0,0 +1,68 @@
+"""Measures login throughput as the bcrypt cost factor and the hashing
+pool size vary. Runs against TEST_DATABASE_URL:
+
+    $ python -m benchmarks.login --logins 40 --concurrency 4
+"""
+
+import json
+import time
+import argparse
+from threading import Thread
+from app import create_app, db
+from app.models import User
+from app.hashing import hasher
+
+
+def run(app, logins, concurrency):
+    """Returns the logins per second made by concurrent clients"""
+    body = json.dumps({'email': 'bench@mail.com', 'password': 'secret'})
+    headers = {'Content-Type': 'application/json'}
+
+    def client():
+        test_client = app.test_client()
+        for _ in range(logins // concurrency):
+            res = test_client.post(
+                '/api/v1/auth/login', data=body, headers=headers)
+            assert res.status_code == 200, res.data
+
+    threads = [Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (logins // concurrency) * concurrency / (
+        time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 12])
+    parser.add_argument('--pool-sizes', type=int, nargs='+',
+                        default=[0, 2, 4])
+    args = parser.parse_args()
+
+    app = create_app(config_name='testing')
+    print('{:>6} {:>9} {:>10}'.format('rounds', 'pool size', 'logins/s'))
+    for rounds in args.rounds:
+        for pool_size in args.pool_sizes:
+            app.config['BCRYPT_ROUNDS'] = rounds
+            app.config['HASHING_POOL_SIZE'] = pool_size
+            hasher.init_app(app)
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                User(username='Bench', email='bench@mail.com',
+                     password='secret').save()
+            rate = run(app, args.logins, args.concurrency)
+            print('{:>6} {:>9} {:>10.1f}'.format(rounds, pool_size, rate))
+
+    hasher.shutdown()
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Measures serializing Order rows with BaseModel.to_dict:
+
+    $ python -m benchmarks.serialize --rows 10000
+"""
+
+import time
+import argparse
+from datetime import datetime
+from app import create_app
+from app.models import Order, OrderStatus
+
+
+def make_orders(rows):
+    now = datetime.now()
+    orders = []
+    for i in range(rows):
+        order = Order(menu_item_id=i % 20 + 1, user_id=i % 100 + 1,
+                      quantity=i % 5 + 1)
+        order.id = i + 1
+        order.status = OrderStatus.PENDING
+        order.created_at = order.updated_at = now
+        orders.append(order)
+    return orders
+
+
+def run(orders, fields=None, repeat=5):
+    """Returns the best time to serialize all the orders"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for order in orders:
+            order.to_dict(fields=fields)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    app = create_app(config_name='testing')
+    with app.app_context():
+        orders = make_orders(args.rows)
+        for fields in [None, ['id', 'quantity', 'status']]:
+            elapsed = run(orders, fields=fields)
+            print('{:<30} {:>8.1f} ms {:>8.2f} us/row'.format(
+                ','.join(fields) if fields else 'all fields',
+                elapsed * 1000, elapsed * 1e6 / args.rows))
+        print('Order._fields: {}'.format(Order._fields))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Measures order placement on one menu item by concurrent workers taking
+the stock from the database rows or from the shared stock counters. Runs
+against TEST_DATABASE_URL:
+
+    $ python -m benchmarks.stock --orders 400 --workers 4
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from multiprocessing import Pool
+from app import create_app, db, stock
+from app.models import User, Meal, Menu, MenuItem
+
+PASSWORD = 'secret'
+
+
+def app_for(counters, flush_interval=None):
+    app = create_app(config_name='testing')
+    app.config['STOCK_COUNTERS'] = counters
+    app.config['STOCK_FLUSH_INTERVAL'] = flush_interval
+    stock.init_app(app)
+    return app
+
+
+def place(args):
+    """Place orders as a worker would, returns the count placed"""
+    counters, orders, user_id, menu_item_id, headers = args
+    app = app_for(counters, flush_interval=1)
+    stock.serve(app)
+    client = app.test_client()
+    body = json.dumps({
+        'quantity': 1, 'user_id': user_id, 'menu_item_id': menu_item_id})
+    placed = 0
+    for _ in range(orders):
+        res = client.post('/api/v1/orders', data=body, headers=headers)
+        assert res.status_code in (201, 400), res.data
+        placed += res.status_code == 201
+
+    # write what is left before the pool ends...
+    if counters:
+        with app.app_context():
+            stock.stock_counters().flush()
+    return placed
+
+
+def run(counters, orders, workers):
+    """Returns the orders per second placed by the workers"""
+    app = app_for(counters)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='Bench', email='bench@mail.com',
+                    password=PASSWORD)
+        user.save()
+        meal = Meal.create({'name': 'ugali', 'cost': 30})
+        menu = Menu.create({'name': 'Lunch'})
+        menu_item = MenuItem.create(
+            {'menu_id': menu.id, 'meal_id': meal.id, 'quantity': orders})
+        user_id, menu_item_id = user.id, menu_item.id
+
+    res = app.test_client().post(
+        '/api/v1/auth/login',
+        data=json.dumps({'email': 'bench@mail.com', 'password': PASSWORD}),
+        headers={'Content-Type': 'application/json'})
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': 'Bearer ' + json.loads(res.data)['access_token']
+    }
+
+    args = (counters, orders // workers, user_id, menu_item_id, headers)
+    with Pool(workers) as pool:
+        start = time.perf_counter()
+        placed = sum(pool.map(place, [args] * workers))
+        elapsed = time.perf_counter() - start
+    assert placed == orders // workers * workers, placed
+    with app.app_context():
+        assert MenuItem.stock(menu_item_id) == orders - placed
+    return placed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'stock')
+    # the pool's workers share the counters as those of one server...
+    stock.boot()
+    print('{:>8} {:>9} {:>9}'.format('stock', 'workers', 'orders/s'))
+    for workers in args.workers:
+        for name, counters in [('database', None), ('counters', path)]:
+            if counters and os.path.exists(counters):
+                os.remove(counters)
+            rate = run(counters, args.orders, workers)
+            print('{:>8} {:>9} {:>9.1f}'.format(name, workers, rate))
+
+    with app_for(None).app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
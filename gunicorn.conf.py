@@ -0,0 +1,17 @@
+"""Settings of the gunicorn server of the web process"""
+
+# the notification streams hold a thread each while they wait
+worker_class = 'gthread'
+threads = 32
+
+
+def on_starting(server):
+    """Give the server the id its workers share the stock counters under"""
+    from app import stock
+    stock.boot()
+
+
+def post_worker_init(worker):
+    """Reconcile and write the stock counters from the workers only"""
+    from app import stock
+    stock.serve(worker.wsgi)
@@ -8,6 +8,14 @@ class Config(object):
     SECRET = os.getenv('SECRET')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # the models only flush within a request which is committed once
+    # when it succeeds and rolled back when it fails
+    UNIT_OF_WORK = True
+
+    # days start at midnight in TIMEZONE while the database keeps its
+    # timestamps in DATABASE_TIMEZONE
+    TIMEZONE = os.getenv('TIMEZONE', 'UTC')
+    DATABASE_TIMEZONE = os.getenv('DATABASE_TIMEZONE', 'UTC')
 
     PROPAGATE_ERRORS = True
     PROPAGATE_EXCEPTIONS = True
@@ -15,6 +23,51 @@ class Config(object):
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access']
+    # seconds between checks for tokens signed out through other workers
+    REVOKED_TOKENS_POLL_INTERVAL = 5
+
+    # authenticated users kept in memory, keyed by their JWT identity
+    IDENTITY_CACHE_SIZE = 1024
+    IDENTITY_CACHE_TTL = 30
+
+    # bcrypt cost factor and the number of processes hashing passwords,
+    # hashing is done on the request thread when the pool size is 0
+    BCRYPT_ROUNDS = 12
+    HASHING_POOL_SIZE = 2
+
+    # seconds before today's menu snapshot is rebuilt to pick up changes
+    # made through the other workers
+    TODAY_MENU_MAX_AGE = 5
+
+    # menu item quantities shared by the workers of a node through this
+    # file, e.g. under /dev/shm, and written to the database by the workers
+    # every STOCK_FLUSH_INTERVAL seconds, as started by gunicorn.conf.py.
+    # Orders take their quantity from the database rows when not set.
+    STOCK_COUNTERS = os.getenv('STOCK_COUNTERS')
+    STOCK_COUNTERS_SIZE = 1024
+    STOCK_FLUSH_INTERVAL = 1
+
+    # responses replayed to the requests retried with the same
+    # Idempotency-Key header, the latest are kept in memory as well
+    IDEMPOTENCY_KEY_EXPIRES = timedelta(hours=24)
+    IDEMPOTENCY_CACHE_SIZE = 1024
+
+    # seconds a request for new notifications waits for some, and a stream
+    # of them lasts. Each holds a worker thread meanwhile, so the server
+    # runs threaded workers. Those made through the other workers are
+    # heard through Postgres LISTEN/NOTIFY when NOTIFICATION_LISTEN is on,
+    # as it is in production.
+    NOTIFICATION_POLL_TIMEOUT = 25
+    NOTIFICATION_STREAM_MAX_AGE = 300
+    NOTIFICATION_LISTEN = False
+
+    # password reset tokens lifetime
+    PASSWORD_RESET_EXPIRES = timedelta(hours=2)
+
+    # expired blacklist and password reset records removal, the sweeper
+    # runs every PRUNE_INTERVAL seconds when set
+    PRUNE_INTERVAL = None
+    PRUNE_BATCH_SIZE = 1000
 
     MAIL_USE_TLS = True
     MAIL_DEBUG = False
@@ -22,6 +75,20 @@ class Config(object):
     MAIL_SERVER = os.getenv('MAIL_SERVER')
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    # mail templates compiled by `manage.py compile_templates`
+    MAIL_COMPILED_TEMPLATES = os.path.join(
+        os.path.dirname(__file__), 'compiled_templates')
+
+    # queued mail is sent every MAIL_SEND_INTERVAL seconds when set, in
+    # batches over one connection, failures are retried after
+    # MAIL_RETRY_BACKOFF seconds doubling on every attempt. Set it in one
+    # process only, or run `manage.py send_mail --forever` on its own as
+    # in the Procfile, since the senders only skip each other's mail on
+    # Postgres.
+    MAIL_SEND_INTERVAL = None
+    MAIL_BATCH_SIZE = 50
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BACKOFF = 30
 
 
 class ProductionConfig(Config):
@@ -30,6 +97,7 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=2)
+    NOTIFICATION_LISTEN = True
 
 
 class DevConfig(Config):
@@ -44,6 +112,10 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL')
+    BCRYPT_ROUNDS = 4
+    HASHING_POOL_SIZE = 0
+    STOCK_COUNTERS = None
+    NOTIFICATION_POLL_TIMEOUT = 1
 
 
 app_config = {
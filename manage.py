@@ -6,6 +6,11 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from app.models import User, UserType
 from app import db, create_app
+from app.sweeper import prune as prune_expired
+from app.mail import (send_queued_mail, send_forever,
+                      compile_templates as compile_mail)
+from app.indexes import (create_indexes as create_missing,
+                         create_search_indexes, seq_scans)
 
 
 app = create_app(config_name=os.getenv('APP_MODE'))
@@ -28,5 +33,59 @@ def seed():
     print('manager: seed complete')
 
 
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=None, help='Rows deleted per transaction')
+def prune(batch_size=None):
+    """Delete expired blacklisted tokens, password resets and idempotency
+    keys"""
+    blacklist, resets, keys = prune_expired(batch_size=batch_size)
+    print('manager: pruned {} blacklisted tokens, {} password resets and {} '
+          'idempotency keys'.format(blacklist, resets, keys))
+
+
+@manager.command
+def send_mail(forever=False, interval=5):
+    """Deliver all the queued mail, or keep sending it every interval
+    seconds"""
+    if forever:
+        print('manager: sending queued mail every {}s'.format(interval))
+        send_forever(app, int(interval))
+    sent = total = send_queued_mail()
+    while sent >= app.config['MAIL_BATCH_SIZE']:
+        sent = send_queued_mail()
+        total += sent
+    print('manager: sent {} queued mails'.format(total))
+
+
+@manager.command
+def compile_templates():
+    """Compile the mail templates ahead of time"""
+    compile_mail(app.config['MAIL_COMPILED_TEMPLATES'])
+    print('manager: compiled mail templates to {}'.format(
+        app.config['MAIL_COMPILED_TEMPLATES']))
+
+
+@manager.command
+def create_indexes():
+    """Create the indexes missing from the database"""
+    for index in create_missing():
+        print('manager: created index {}'.format(index.name))
+    for name in create_search_indexes():
+        print('manager: created search index {}'.format(name))
+    print('manager: indexes are up to date')
+
+
+@manager.command
+def scans():
+    """Report the tables still read by sequential scans"""
+    rows = seq_scans()
+    if rows is None:
+        print('manager: scan statistics are only available on postgres')
+        return
+    for name, seq_scan, seq_read, idx_scan, live in rows:
+        print('{}: {} seq scans reading {} rows, {} index scans, {} rows'
+              .format(name, seq_scan, seq_read, idx_scan or 0, live))
+
+
 if __name__ == '__main__':
     manager.run()
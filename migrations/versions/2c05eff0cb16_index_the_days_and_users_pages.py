@@ -0,0 +1,37 @@
+"""index the days and users' pages
+
+Revision ID: 2c05eff0cb16
+Revises: 8c3efc78f65e
+Create Date: 2026-10-17 23:05:44.043952
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2c05eff0cb16'
+down_revision = '8c3efc78f65e'
+branch_labels = None
+depends_on = None
+
+
+# the indexes by name, with their table and columns
+INDEXES = [
+    ('ix_menu_items_created_at', 'menu_items', 'created_at'),
+    ('ix_notifications_user_id_id', 'notifications', 'user_id, id'),
+    ('ix_orders_created_at', 'orders', 'created_at'),
+    ('ix_orders_user_id_id', 'orders', 'user_id, id'),
+]
+
+
+def upgrade():
+    # a live database may have them made concurrently beforehand by
+    # manage.py create_indexes
+    for name, table, columns in INDEXES:
+        op.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+            name, table, columns))
+
+
+def downgrade():
+    for name, _, _ in reversed(INDEXES):
+        op.execute('DROP INDEX IF EXISTS {}'.format(name))
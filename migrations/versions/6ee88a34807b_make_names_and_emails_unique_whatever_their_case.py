@@ -0,0 +1,56 @@
+"""make names and emails unique whatever their case
+
+Revision ID: 6ee88a34807b
+Revises: e0d3ffff70ef
+Create Date: 2026-10-17 23:06:12.086506
+
+The upgrade fails while names or emails differing only by their case are
+still stored, which have to be renamed first.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6ee88a34807b'
+down_revision = 'e0d3ffff70ef'
+branch_labels = None
+depends_on = None
+
+
+# the unique constraints replaced by case insensitive unique indexes
+CONSTRAINTS = [
+    ('meals', 'meals_name_key', 'name'),
+    ('users', 'users_email_key', 'email'),
+]
+
+# the case insensitive unique indexes by name, with their table and column
+INDEXES = [
+    ('ix_meals_lower_name', 'meals', 'name'),
+    ('ix_menus_lower_name', 'menus', 'name'),
+    ('ix_users_lower_email', 'users', 'email'),
+]
+
+
+def upgrade():
+    # before the indexes, as SQLite copies the tables without them
+    for table, name, _ in CONSTRAINTS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(name, type_='unique')
+    # the email index was not unique until now
+    op.execute('DROP INDEX IF EXISTS ix_users_lower_email')
+    for name, table, column in INDEXES:
+        op.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (lower({}))'.format(
+                name, table, column))
+
+
+def downgrade():
+    for table, name, column in CONSTRAINTS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_unique_constraint(name, [column])
+    for name, _, _ in reversed(INDEXES):
+        op.execute('DROP INDEX IF EXISTS {}'.format(name))
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_users_lower_email ON users '
+        '(lower(email))')
@@ -0,0 +1,34 @@
+"""track the read and unread notifications
+
+Revision ID: 86e68e4bacc0
+Revises: 254f91a35832
+Create Date: 2026-10-17 23:06:52.323907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '86e68e4bacc0'
+down_revision = '254f91a35832'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notifications', sa.Column('read_at', sa.DateTime(), nullable=True))
+    op.add_column('users', sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+    # a live database may have it made concurrently beforehand by
+    # manage.py create_indexes
+    op.execute('CREATE INDEX IF NOT EXISTS ix_notifications_unread ON '
+               'notifications (user_id, id) WHERE read_at IS NULL')
+    # none of the notifications made until now was read
+    op.execute('UPDATE users SET unread_notifications = (SELECT count(*) '
+               'FROM notifications WHERE notifications.user_id = users.id)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_notifications_unread')
+    op.drop_column('users', 'unread_notifications')
+    op.drop_column('notifications', 'read_at')
@@ -0,0 +1,41 @@
+"""index the foreign keys and tokens
+
+Revision ID: e0d3ffff70ef
+Revises: 2c05eff0cb16
+Create Date: 2026-10-17 23:06:02.808814
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e0d3ffff70ef'
+down_revision = '2c05eff0cb16'
+branch_labels = None
+depends_on = None
+
+
+# the indexes by name, with their table and columns
+INDEXES = [
+    ('ix_blacklist_token', 'blacklist', 'token'),
+    ('ix_menu_items_meal_id', 'menu_items', 'meal_id'),
+    ('ix_menu_items_menu_id', 'menu_items', 'menu_id'),
+    ('ix_orders_menu_item_id', 'orders', 'menu_item_id'),
+    ('ix_password_resets_token', 'password_resets', 'token'),
+    ('ix_password_resets_user_id', 'password_resets', 'user_id'),
+    ('ix_users_lower_email', 'users', 'lower(email)'),
+    ('ix_users_token', 'users', 'token'),
+]
+
+
+def upgrade():
+    # a live database may have them made concurrently beforehand by
+    # manage.py create_indexes
+    for name, table, columns in INDEXES:
+        op.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+            name, table, columns))
+
+
+def downgrade():
+    for name, _, _ in reversed(INDEXES):
+        op.execute('DROP INDEX IF EXISTS {}'.format(name))
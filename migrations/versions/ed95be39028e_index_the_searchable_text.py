@@ -0,0 +1,73 @@
+"""index the searchable text
+
+Revision ID: ed95be39028e
+Revises: 86e68e4bacc0
+Create Date: 2026-10-17 23:07:03.997660
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'ed95be39028e'
+down_revision = '86e68e4bacc0'
+branch_labels = None
+depends_on = None
+
+
+# the searchable text columns by table
+COLUMNS = [
+    ('meals', ['name']),
+    ('menus', ['name']),
+    ('users', ['username', 'email']),
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, columns in COLUMNS:
+        if dialect == 'postgresql':
+            document = "to_tsvector('simple', {})".format(" || ' ' || ".join(
+                "coalesce({}, '')".format(column) for column in columns))
+            # a live database may have it made concurrently beforehand by
+            # manage.py create_indexes
+            op.execute(
+                'CREATE INDEX IF NOT EXISTS ix_{0}_search ON {0} '
+                'USING gin (({1}))'.format(table, document))
+        elif dialect == 'sqlite':
+            names = ', '.join(columns)
+            new = ', '.join('new.' + column for column in columns)
+            old = ', '.join('old.' + column for column in columns)
+            insert = ('INSERT INTO {0}_search(rowid, {1}) '
+                      'VALUES (new.id, {2});').format(table, names, new)
+            delete = ("INSERT INTO {0}_search({0}_search, rowid, {1}) "
+                      "VALUES ('delete', old.id, {2});").format(
+                          table, names, old)
+            op.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {0}_search USING "
+                "fts5({1}, content='{0}', content_rowid='id')".format(
+                    table, names))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {0}_search_insert AFTER INSERT '
+                'ON {0} BEGIN {1} END'.format(table, insert))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {0}_search_delete AFTER DELETE '
+                'ON {0} BEGIN {1} END'.format(table, delete))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {0}_search_update AFTER UPDATE '
+                'ON {0} BEGIN {1} {2} END'.format(table, delete, insert))
+            op.execute(
+                "INSERT INTO {0}_search({0}_search) VALUES ('rebuild')".format(
+                    table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, _ in reversed(COLUMNS):
+        if dialect == 'postgresql':
+            op.execute('DROP INDEX IF EXISTS ix_{}_search'.format(table))
+        elif dialect == 'sqlite':
+            for trigger in ('update', 'delete', 'insert'):
+                op.execute('DROP TRIGGER IF EXISTS {}_search_{}'.format(
+                    table, trigger))
+            op.execute('DROP TABLE IF EXISTS {}_search'.format(table))
@@ -2,7 +2,7 @@
 
 
 import os
-from app import create_app
+from app import create_app, stock
 
 
 config_name = os.getenv('APP_MODE')
@@ -10,4 +10,5 @@ app = create_app(config_name)
 
 
 if __name__ == '__main__':
+    stock.serve(app)
     app.run()
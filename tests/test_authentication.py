@@ -1,6 +1,10 @@
 import json
+from datetime import timedelta
 from app import create_app, db
-from app.models import User, UserType
+from app.models import User, UserType, Blacklist
+from app.sweeper import prune
+from app.hashing import hasher
+from flask_jwt_extended import decode_token
 from .base import BaseTest
 
 
@@ -32,6 +36,22 @@ class AuthenticationTestCase(BaseTest):
         self.assertEqual(res.status_code, 201)
         self.assertIn(b'Successfully registered account', res.data)
 
+    def test_cannot_register_with_taken_email(self):
+        res = self.client.post(
+            'api/v1/auth/signup',
+            data=self.data(),
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 201)
+        res = self.client.post(
+            'api/v1/auth/signup',
+            data=self.data_with({'email': self.to_dict(res)[
+                'user']['email'].upper()}),
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'The email is already taken', res.data)
+
     def test_cannot_register_without_email(self):
         res = self.client.post(
             'api/v1/auth/signup',
@@ -121,6 +141,19 @@ class AuthenticationTestCase(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully logged in', res.data)
 
+    def test_can_login_whatever_the_email_case(self):
+        user, headers = self.authUser(email='Jane@Mail.com')
+        res = self.client.post(
+            'api/v1/auth/login',
+            data=json.dumps({
+                'email': 'jane@MAIL.com',
+                'password': 'secret'
+            }),
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['user']['id'], user['id'])
+
     def test_cannot_login_without_email(self):
         """Test user can login"""
         user, headers = self.authUser()
@@ -166,6 +199,19 @@ class AuthenticationTestCase(BaseTest):
         )
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully logged out', res.data)
+        res = self.client.get('api/v1/auth', headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_token_revoked_by_another_worker_is_rejected(self):
+        user, headers = self.authUser()
+        res = self.client.get('api/v1/auth', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            token = headers['Authorization'].split()[1]
+            Blacklist(token=decode_token(token)['jti']).save()
+        self.app.extensions['revoked_tokens'].poll_interval = 0
+        res = self.client.get('api/v1/auth', headers=headers)
+        self.assertEqual(res.status_code, 401)
 
     def test_can_request_password_reset(self):
         res = self.client.post(
@@ -209,6 +255,50 @@ class AuthenticationTestCase(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Password successfully reset', res.data)
 
+    def test_cannot_make_expired_password_reset(self):
+        res = self.client.post(
+            'api/v1/auth/signup',
+            data=self.data(),
+            headers=self.headers
+        )
+        res = self.client.post(
+            'api/v1/auth/password-reset',
+            data=self.data(),
+            headers=self.headers
+        )
+        json_res = self.to_dict(res)
+        self.app.config['PASSWORD_RESET_EXPIRES'] = timedelta(hours=-48)
+        res = self.client.put(
+            'api/v1/auth/password-reset',
+            data=json.dumps({
+                'token': json_res['token'],
+                'password': 'secret2',
+                'password_confirmation': 'secret2'
+            }),
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'token has expired', res.data)
+
+    def test_password_is_rehashed_when_cost_changes(self):
+        user, headers = self.authUser()
+        hasher.rounds = 5
+        try:
+            self._authenticate(user)
+        finally:
+            hasher.rounds = self.app.config['BCRYPT_ROUNDS']
+        with self.app.app_context():
+            password = User.query.get(user['id']).password
+            self.assertIn('$05$', password)
+
+    def test_can_prune_expired_records(self):
+        with self.app.app_context():
+            Blacklist(token='revoked').save()
+            self.app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(
+                hours=-48)
+            self.assertEqual(prune(batch_size=1), (1, 0, 0))
+            self.assertEqual(Blacklist.query.count(), 0)
+
     def tearDown(self):
         with self.app.app_context():
             db.drop_all()
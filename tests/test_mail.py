@@ -0,0 +1,175 @@
+import tempfile
+import threading
+import socketserver
+from unittest import mock
+from jinja2 import ModuleLoader
+from datetime import datetime
+from app import create_app, db
+from app.models import Outbox
+from app.mail import (mail, queue_mail, send_queued_mail, render,
+                      environment, compile_templates, init_sender)
+from .base import BaseTest
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """A local SMTP server recording the messages received over each of
+    its connections, dropping the first one as the given count of messages
+    has been received over it"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after=None):
+        super().__init__(('localhost', 0), SMTPHandler)
+        self.drop_after = drop_after
+        self.connections = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to send mail"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        received = []
+        with self.server.lock:
+            self.server.connections.append(received)
+        self.reply('220 localhost stub')
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith('DATA'):
+                self.reply('354 end with .')
+                data = []
+                for line in self.rfile:
+                    if line.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(line)
+                with self.server.lock:
+                    drop = len(received) == self.server.drop_after
+                    if drop:
+                        self.server.drop_after = None
+                if drop:
+                    # gone before the message is accepted...
+                    return
+                received.append(b''.join(data))
+                self.reply('250 queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 bye')
+                return
+            elif command.startswith(('EHLO', 'HELO', 'MAIL', 'RCPT', 'RSET',
+                                     'NOOP')):
+                self.reply('250 ok')
+            else:
+                self.reply('502 not implemented')
+
+
+class TestMail(BaseTest):
+    """This will test the queued mail sender"""
+
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        with self.app.app_context():
+            db.create_all()
+            queue_mail('Email Verification', 'john@doe.com', '<p>Hi</p>')
+            queue_mail('Password Reset', 'jane@doe.com', '<p>Hi</p>')
+
+    def test_can_send_queued_mail(self):
+        with self.app.app_context():
+            with mail.record_messages() as outbox:
+                self.assertEqual(send_queued_mail(), 2)
+            self.assertEqual(len(outbox), 2)
+            self.assertEqual(outbox[0].recipients, ['john@doe.com'])
+            self.assertEqual(
+                Outbox.query.filter(Outbox.sent_at.is_(None)).count(), 0)
+            # nothing is sent twice...
+            self.assertEqual(send_queued_mail(), 0)
+
+    def test_sender_only_runs_where_configured(self):
+        with mock.patch('app.mail.Thread') as thread:
+            init_sender(self.app)
+            thread.assert_not_called()
+            self.app.config['MAIL_SEND_INTERVAL'] = 60
+            init_sender(self.app)
+            thread.assert_called_once()
+
+    def test_failed_mail_is_retried_later(self):
+        state = self.app.extensions['mail']
+        state.suppress = False
+        state.server, state.port, state.use_tls = 'localhost', 1, False
+        with self.app.app_context():
+            self.assertEqual(send_queued_mail(), 0)
+            for outbox in Outbox.query.all():
+                self.assertEqual(outbox.attempts, 1)
+                self.assertIsNotNone(outbox.last_error)
+                self.assertGreater(outbox.send_after, datetime.utcnow())
+            # not retried before the backoff...
+            self.assertEqual(len(Outbox.due(5, 10)), 0)
+
+    def send_to(self, server):
+        """Send the queued mail to the SMTP server, returning the count
+        sent"""
+        state = self.app.extensions['mail']
+        state.suppress = False
+        state.server, state.port = server.server_address
+        state.use_tls = state.use_ssl = False
+        state.username = state.password = None
+        with self.app.app_context():
+            return send_queued_mail()
+
+    def test_batch_is_sent_over_one_connection(self):
+        with self.app.app_context():
+            for i in range(3):
+                queue_mail('Order', 'user{}@doe.com'.format(i), '<p>Hi</p>')
+        server = SMTPStub()
+        try:
+            self.assertEqual(self.send_to(server), 5)
+        finally:
+            server.stop()
+        self.assertEqual(len(server.connections), 1)
+        self.assertEqual(len(server.connections[0]), 5)
+        self.assertIn(b'john@doe.com', server.connections[0][0])
+
+    def test_dropped_connection_is_made_again(self):
+        server = SMTPStub(drop_after=1)
+        try:
+            self.assertEqual(self.send_to(server), 2)
+        finally:
+            server.stop()
+        # the mail the server dropped is sent again, not lost...
+        self.assertEqual([len(messages) for messages in server.connections],
+                         [1, 1])
+        self.assertIn(b'jane@doe.com', server.connections[1][0])
+        with self.app.app_context():
+            self.assertEqual(
+                Outbox.query.filter(Outbox.sent_at.is_(None)).count(), 0)
+
+    def test_cached_render_matches_template(self):
+        link = 'http://localhost/verify?token=a&b=<c>'
+        with self.app.app_context():
+            expected = environment().get_template(
+                'email_verification.html').render(message={'link': link})
+            self.assertEqual(render('email_verification.html', link),
+                             expected)
+            self.assertEqual(render('email_verification.html', link),
+                             expected)
+
+    def test_can_render_compiled_templates(self):
+        with self.app.app_context(), tempfile.TemporaryDirectory() as path:
+            self.app.config['MAIL_COMPILED_TEMPLATES'] = path
+            compile_templates(path)
+            html = render('password_reset.html', 'http://localhost/reset')
+            self.assertIn('http://localhost/reset', html)
+            self.assertIn('Reset Password', html)
+            self.assertIsInstance(
+                environment().loader.loaders[0], ModuleLoader)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
@@ -139,11 +139,12 @@ class TestMeals(BaseTest):
         res = self.client.put(
             'api/v1/meals/{}'.format(json_res['meal']['id']),
             data=self.data_with({
-                'name': 'ugali'
+                'name': 'Ugali'
             }),
             headers=self.admin_headers)
         self.assertEqual(res.status_code, 400)
-        self.assertIn(b'Meal name must be unique', res.data)
+        self.assertEqual(self.to_dict(res)['errors'],
+                         {'name': ['The name is already taken.']})
 
     def test_can_get_paginated_meals(self):
         self.create_meal(self.data_with({'name': 'beef'}))
@@ -153,6 +154,29 @@ class TestMeals(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully retrieved meals', res.data)
 
+    def test_can_search_meals_best_matches_first(self):
+        for name in ['ugali', 'beef stew with rice and greens', 'beef',
+                     'pilau']:
+            self.create_meal(self.data_with({'name': name}))
+        res = self.client.get(
+            'api/v1/meals?search=bee', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [meal['name'] for meal in self.to_dict(res)['meals']],
+            ['beef', 'beef stew with rice and greens'])
+
+    def test_can_search_renamed_meals(self):
+        json_res = self.create_meal(self.data())
+        res = self.client.put(
+            'api/v1/meals/{}'.format(json_res['meal']['id']),
+            data=self.data_with({'name': 'pilau'}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        for term, count in [('ugali', 0), ('pilau', 1)]:
+            res = self.client.get(
+                'api/v1/meals?search=' + term, headers=self.user_headers)
+            self.assertEqual(len(self.to_dict(res)['meals']), count)
+
     def test_can_delete_meal(self):
         json_res = self.create_meal(self.data())
         res = self.client.delete(
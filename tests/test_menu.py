@@ -145,7 +145,8 @@ class TestMenu(BaseTest):
             headers=self.admin_headers
         )
         self.assertEqual(res.status_code, 400)
-        self.assertIn(b'must be unique', res.data)
+        self.assertEqual(self.to_dict(res)['errors'],
+                         {'name': ['The name is already taken.']})
 
     def create_menu(self, data):
         res = self.client.post(
@@ -127,6 +127,19 @@ class MenuItemTests(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully retrieved', res.data)
 
+    def test_menus_list_their_menu_items(self):
+        self.create_menu_item(self.data())
+        self.create_menu(name='Supper')
+        res = self.client.get(
+            'api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        menus = {menu['name']: menu for menu in self.to_dict(res)['menus']}
+        self.assertEqual(menus['Supper']['menu_items'], [])
+        menu_items = menus['Lunch']['menu_items']
+        self.assertEqual(len(menu_items), 1)
+        self.assertEqual(menu_items[0]['meal']['name'], 'ugali')
+        self.assertNotIn('menu', menu_items[0])
+
     def test_can_delete_menu_item(self):
         menu_item = self.create_menu_item(self.data())
         res = self.client.delete(
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flask_migrate import Migrate, upgrade, downgrade
+from instance.config import TestingConfig
+from app import create_app, db
+
+# the migrations directory of the application
+MIGRATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'migrations')
+
+
+class TestMigrations(unittest.TestCase):
+    """This will test that the migrations make the models' schema"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def schema(self, migrate):
+        """The tables, columns, indexes and triggers of a new SQLite
+        database, made by the migrations or by the models"""
+        uri = 'sqlite:///' + os.path.join(
+            self.directory, 'migrated.db' if migrate else 'created.db')
+        with mock.patch.object(TestingConfig, 'SQLALCHEMY_DATABASE_URI', uri):
+            app = create_app(config_name='testing')
+        Migrate(app, db, directory=MIGRATIONS)
+        with app.app_context():
+            if migrate:
+                upgrade()
+            else:
+                db.create_all()
+            schema = set()
+            for kind, name, table in db.session.execute(
+                    "SELECT type, name, tbl_name FROM sqlite_master "
+                    "WHERE name NOT LIKE 'sqlite_%' "
+                    "AND name != 'alembic_version'").fetchall():
+                schema.add((kind, name, table))
+                if kind == 'table':
+                    schema.update(('column', row[1], name) for row in
+                                  db.session.execute(
+                                      'PRAGMA table_info({})'.format(name)))
+            db.session.remove()
+        return app, schema
+
+    def test_migrations_make_the_models_schema(self):
+        _, created = self.schema(migrate=False)
+        _, migrated = self.schema(migrate=True)
+        self.assertEqual(migrated, created)
+
+    def test_migrations_can_be_undone(self):
+        app, _ = self.schema(migrate=True)
+        with app.app_context():
+            downgrade(revision='base')
+            self.assertEqual(db.session.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name != 'alembic_version'").fetchall(), [])
+            db.session.remove()
@@ -0,0 +1,95 @@
+from flask import abort
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Order, Meal, Menu
+from app.indexes import (missing_indexes, create_indexes,
+                         create_search_indexes)
+from .base import BaseTest
+
+
+class TestModels(BaseTest):
+    """This will test the models serialization"""
+
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        with self.app.app_context():
+            db.create_all()
+
+    def test_to_dict_leaves_fields_untouched(self):
+        fields = list(Order._fields)
+        with self.app.app_context():
+            order = Order(menu_item_id=1, user_id=1, quantity=2)
+            order.to_dict()
+            order.to_dict()
+        self.assertEqual(Order._fields, fields)
+
+    def test_to_dict_hides_hidden_fields(self):
+        with self.app.app_context():
+            user = User(username='John', email='john@doe.com',
+                        password='secret')
+            user.save()
+            dict_repr = user.to_dict()
+            self.assertNotIn('password', dict_repr)
+            self.assertNotIn('token', dict_repr)
+            self.assertIsInstance(dict_repr['created_at'], str)
+            self.assertEqual(
+                list(dict_repr.keys())[:3], ['id', 'created_at', 'updated_at'])
+            self.assertEqual(
+                user.to_dict(fields=['email', 'password', 'unknown']),
+                {'email': 'john@doe.com'})
+
+    def test_create_indexes_creates_the_missing_indexes(self):
+        with self.app.app_context():
+            self.assertEqual(missing_indexes(), [])
+            db.session.execute('DROP INDEX ix_menu_items_menu_id')
+            db.session.commit()
+            self.assertEqual(
+                [index.name for index in create_indexes()],
+                ['ix_menu_items_menu_id'])
+            self.assertEqual(missing_indexes(), [])
+
+    def test_create_search_indexes_fills_the_missing_ones(self):
+        with self.app.app_context():
+            Meal.create({'name': 'ugali', 'cost': 30})
+            self.assertEqual(create_search_indexes(), [])
+            db.session.execute('DROP TABLE meals_search')
+            db.session.commit()
+            self.assertEqual(create_search_indexes(), ['meals_search'])
+            self.assertEqual(Meal.paginate(
+                filters={'search': 'ugali'}, name='meals')['total'], 1)
+
+    def test_request_commits_once(self):
+        @self.app.route('/menus-and-meals', methods=['POST'])
+        def create():
+            Menu.create({'name': 'Lunch'})
+            Meal.create({'name': 'ugali', 'cost': 30})
+            return 'created'
+
+        commits = []
+        listener = lambda session: commits.append(session)
+        with self.app.app_context():
+            event.listen(db.session, 'after_commit', listener)
+            try:
+                res = self.app.test_client().post('/menus-and-meals')
+            finally:
+                event.remove(db.session, 'after_commit', listener)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(commits), 1)
+            self.assertEqual(Meal.query.count(), 1)
+            self.assertEqual(Menu.query.count(), 1)
+
+    def test_failed_request_writes_nothing(self):
+        @self.app.route('/menus-and-meals', methods=['POST'])
+        def create():
+            Menu.create({'name': 'Lunch'})
+            Meal.create({'name': 'ugali', 'cost': 30})
+            abort(400)
+
+        self.app.test_client().post('/menus-and-meals')
+        with self.app.app_context():
+            self.assertEqual(Meal.query.count(), 0)
+            self.assertEqual(Menu.query.count(), 0)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
@@ -1,6 +1,10 @@
 import json
-from app import create_app, db
-from app.models import Notification
+import time
+import threading
+from threading import Timer
+from datetime import date, timedelta
+from app import create_app, db, hub
+from app.models import User, Notification
 from .base import BaseTest
 
 
@@ -42,6 +46,42 @@ class NotificationTest(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully retrieved notifications', res.data)
 
+    def test_can_get_notifications_by_cursor(self):
+        with self.app.app_context():
+            for i in range(2):
+                Notification.create({
+                    'user_id': self.user['id'],
+                    'title': 'Notification {}'.format(i),
+                    'message': 'Hi there user, we are testing this.'
+                })
+        res = self.client.get(
+            'api/v1/notifications?cursor=&per_page=2',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        json_res = self.to_dict(res)
+        self.assertNotIn('total', json_res)
+        self.assertTrue(json_res['has_next'])
+        self.assertEqual(
+            [n['id'] for n in json_res['notifications']], [4, 3])
+        res = self.client.get(
+            'api/v1/notifications?per_page=2&cursor={}'.format(
+                json_res['next_cursor']),
+            headers=self.user_headers
+        )
+        json_res = self.to_dict(res)
+        self.assertFalse(json_res['has_next'])
+        self.assertIsNone(json_res['next_cursor'])
+        self.assertEqual([n['id'] for n in json_res['notifications']], [1])
+
+    def test_cannot_get_notifications_by_invalid_cursor(self):
+        res = self.client.get(
+            'api/v1/notifications?cursor=invalid',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'cursor format is invalid', res.data)
+
     def test_can_delete_one_notification(self):
         res = self.client.delete(
             'api/v1/notifications/1',
@@ -69,6 +109,152 @@ class NotificationTest(BaseTest):
         print(res.data)
         self.assertEqual(res.status_code, 404)
 
+    def test_can_delete_selected_notifications(self):
+        with self.app.app_context():
+            Notification.create({
+                'user_id': self.user['id'],
+                'title': 'Another notification',
+                'message': 'Hi there user, we are testing this.'
+            })
+        res = self.client.delete(
+            'api/v1/notifications?ids=1,2',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        # the admin's notification is left alone...
+        self.assertEqual(self.to_dict(res)['count'], 1)
+        with self.app.app_context():
+            self.assertEqual(
+                [n.id for n in Notification.query.order_by(Notification.id)],
+                [2, 3])
+
+    def test_can_delete_notifications_before_a_day(self):
+        for day, count in [(date.today() - timedelta(days=1), 0),
+                           (date.today() + timedelta(days=1), 1)]:
+            res = self.client.delete(
+                'api/v1/notifications?before={}'.format(day),
+                headers=self.user_headers
+            )
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(self.to_dict(res)['count'], count)
+
+    def test_cannot_delete_notifications_by_invalid_filters(self):
+        for qs, error in [('ids=1,a', b'ids must be an integer'),
+                          ('before=yesterday', b'before is not a valid date')]:
+            res = self.client.delete(
+                'api/v1/notifications?{}'.format(qs),
+                headers=self.user_headers
+            )
+            self.assertEqual(res.status_code, 400)
+            self.assertIn(error, res.data)
+
+    def test_empty_ids_do_not_delete_all_notifications(self):
+        res = self.client.delete(
+            'api/v1/notifications?ids=',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'ids must be an integer', res.data)
+        with self.app.app_context():
+            self.assertEqual(Notification.query.filter_by(
+                user_id=self.user['id']).count(), 1)
+
+    def unread(self):
+        res = self.client.get(
+            'api/v1/notifications/unread-count',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        return self.to_dict(res)['unread']
+
+    def test_can_read_notification(self):
+        self.assertEqual(self.unread(), 1)
+        for _ in range(2):
+            res = self.client.put(
+                'api/v1/notifications/1/read',
+                headers=self.user_headers
+            )
+            self.assertEqual(res.status_code, 200)
+            self.assertIsNotNone(self.to_dict(res)['notification']['read_at'])
+            self.assertEqual(self.unread(), 0)
+        res = self.client.get(
+            'api/v1/notifications?unread=1',
+            headers=self.user_headers
+        )
+        self.assertEqual(self.to_dict(res)['notifications'], [])
+
+    def test_notification_read_concurrently_is_counted_once(self):
+        with self.app.app_context():
+            notification = Notification.query.get(1)
+            # read by another request since it was loaded...
+            db.session.execute(
+                'UPDATE notifications SET read_at = CURRENT_TIMESTAMP')
+            self.assertFalse(notification.read())
+            self.assertIsNotNone(notification.read_at)
+            # left for the other request to count...
+            self.assertEqual(Notification.unread(self.user['id']), 1)
+
+    def test_notifications_leave_users_untouched(self):
+        with self.app.app_context():
+            db.session.execute(
+                "UPDATE users SET updated_at = '2000-01-01 00:00:00'")
+            db.session.commit()
+            self.notify_user()
+            Notification.read_all(self.user['id'])
+            db.session.commit()
+            self.assertEqual(
+                str(User.query.get(self.user['id']).updated_at),
+                '2000-01-01 00:00:00')
+
+    def test_cannot_mark_notification_read_by_update(self):
+        with self.app.app_context():
+            notification = Notification.query.get(1)
+            notification.update({'title': 'Updated', 'read_at': None})
+            notification.from_dict({'read_at': '2020-01-01'})
+            self.assertIsNone(notification.read_at)
+            self.assertEqual(notification.title, 'Updated')
+
+    def test_cannot_read_other_users_notification(self):
+        res = self.client.put(
+            'api/v1/notifications/2/read',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 401)
+
+    def test_can_read_all_notifications(self):
+        with self.app.app_context():
+            Notification.create({
+                'user_id': self.user['id'],
+                'title': 'Another notification',
+                'message': 'Hi there user, we are testing this.'
+            })
+        self.assertEqual(self.unread(), 2)
+        res = self.client.put(
+            'api/v1/notifications/read',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['count'], 2)
+        self.assertEqual(self.unread(), 0)
+
+    def test_deleted_notifications_are_not_unread(self):
+        with self.app.app_context():
+            for i in range(2):
+                Notification.create({
+                    'user_id': self.user['id'],
+                    'title': 'Notification {}'.format(i),
+                    'message': 'Hi there user, we are testing this.'
+                })
+        self.assertEqual(self.unread(), 3)
+        self.client.delete(
+            'api/v1/notifications/1', headers=self.user_headers)
+        self.assertEqual(self.unread(), 2)
+        self.client.delete(
+            'api/v1/notifications?ids=3', headers=self.user_headers)
+        self.assertEqual(self.unread(), 1)
+        self.client.delete('api/v1/notifications', headers=self.user_headers)
+        self.assertEqual(self.unread(), 0)
+
     def test_cannot_delete_other_users_notification(self):
         res = self.client.delete(
             'api/v1/notifications/2',
@@ -77,6 +263,106 @@ class NotificationTest(BaseTest):
         self.assertEqual(res.status_code, 401)
         self.assertIn(b'Unauthorized to delete this notification', res.data)
 
+    def notify_user(self):
+        with self.app.app_context():
+            Notification.create({
+                'user_id': self.user['id'],
+                'title': 'New notification',
+                'message': 'Hi there user, we are testing this.'
+            })
+
+    def test_can_poll_new_notifications(self):
+        res = self.client.get(
+            'api/v1/notifications/stream?since_id=0',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        json_res = self.to_dict(res)
+        self.assertEqual(
+            [n['id'] for n in json_res['notifications']], [1])
+        self.assertEqual(json_res['since_id'], 1)
+
+    def test_poll_waits_for_new_notifications(self):
+        self.app.config['NOTIFICATION_POLL_TIMEOUT'] = 10
+        Timer(0.2, self.notify_user).start()
+        start = time.monotonic()
+        res = self.client.get(
+            'api/v1/notifications/stream', headers=self.user_headers)
+        self.assertLess(time.monotonic() - start, 5)
+        json_res = self.to_dict(res)
+        self.assertEqual(
+            [n['title'] for n in json_res['notifications']],
+            ['New notification'])
+
+    def test_poll_times_out_without_new_notifications(self):
+        self.app.config['NOTIFICATION_POLL_TIMEOUT'] = 0.2
+        res = self.client.get(
+            'api/v1/notifications/stream?since_id=1',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        json_res = self.to_dict(res)
+        self.assertEqual(json_res['notifications'], [])
+        self.assertEqual(json_res['since_id'], 1)
+
+    def test_cannot_poll_by_invalid_since_id(self):
+        res = self.client.get(
+            'api/v1/notifications/stream?since_id=one',
+            headers=self.user_headers
+        )
+        self.assertEqual(res.status_code, 400)
+
+    def open_stream(self):
+        # closing the stream is not an error to keep the context for
+        self.app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+        headers = dict(self.user_headers, Accept='text/event-stream')
+        headers['Last-Event-ID'] = '0'
+        res = self.client.get('api/v1/notifications/stream',
+                              headers=headers, buffered=False)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        self.assertTrue(next(res.response).startswith(b'id: 1\n'))
+        return res
+
+    def test_stream_ends_once_its_token_is_revoked(self):
+        self.app.config['NOTIFICATION_POLL_TIMEOUT'] = 0.2
+        res = self.open_stream()
+        self.client.delete('api/v1/auth/logout', headers=self.user_headers)
+        self.assertEqual(list(res.response), [])
+        res.close()
+
+    def test_stream_ends_after_its_max_age(self):
+        self.app.config['NOTIFICATION_STREAM_MAX_AGE'] = 0.3
+        res = self.open_stream()
+        self.assertEqual(list(res.response), [b': keep-alive\n\n'])
+        res.close()
+
+    def test_hub_listens_only_when_broadcasting_on_postgres(self):
+        for uri, broadcast in [('sqlite:////tmp/listen.db', False),
+                               ('postgresql://localhost/bam', True)]:
+            app = create_app(config_name='testing')
+            app.config['SQLALCHEMY_DATABASE_URI'] = uri
+            app.config['NOTIFICATION_LISTEN'] = True
+            hub.init_app(app)
+            self.assertEqual(
+                app.extensions['notification_hub'].broadcast, broadcast)
+        # not until a request waits for notifications...
+        self.assertNotIn('notification-listener',
+                         [thread.name for thread in threading.enumerate()])
+
+    def test_can_stream_new_notifications(self):
+        # closing the stream is not an error to keep the context for
+        self.app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+        headers = dict(self.user_headers, Accept='text/event-stream')
+        headers['Last-Event-ID'] = '0'
+        res = self.client.get('api/v1/notifications/stream',
+                              headers=headers, buffered=False)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        event = next(res.response)
+        self.assertTrue(event.startswith(b'id: 1\nevent: notification\n'))
+        Timer(0.2, self.notify_user).start()
+        self.assertTrue(next(res.response).startswith(b'id: 3\n'))
+        res.close()
+
     def tearDown(self):
         with self.app.app_context():
             db.drop_all()
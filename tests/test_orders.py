@@ -1,12 +1,35 @@
+import os
 import json
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
 from app import create_app, db
-from app.models import User, UserType
+from app.exceptions import ValidationException
+from instance.config import TestingConfig
+from app.middlewares.auth import user_auth
+from app.middlewares.idempotency import idempotent
+from app.models import (User, UserType, Meal, Menu, MenuItem, Order,
+                        OrderStatus, Notification, IdempotencyKey)
 from .base import BaseTest
 
 
 class TestOrders(BaseTest):
     def setUp(self):
         self.app = create_app(config_name='testing')
+
+        @self.app.route('/idempotent-headers', methods=['POST'])
+        @user_auth
+        @idempotent
+        def idempotent_headers():
+            return {'success': True}, 201, {'X-Made': 'yes'}
+
+        @self.app.route('/idempotent-error', methods=['POST'])
+        @user_auth
+        @idempotent
+        def idempotent_error():
+            raise KeyError('original')
+
         self.client = self.app.test_client()
         with self.app.app_context():
             db.create_all()
@@ -59,6 +82,308 @@ class TestOrders(BaseTest):
         self.assertEqual(res.status_code, 400)
         self.assertIn(b'meal(s) are available', res.data)
 
+    def test_concurrent_orders_cannot_oversell(self):
+        menu_item = self.create_menu_item()['menu_item']
+        data = json.dumps({
+            'quantity': 1,
+            'user_id': self.user['id'],
+            'menu_item_id': menu_item['id']
+        })
+
+        def order(i):
+            try:
+                res = self.app.test_client().post(
+                    'api/v1/orders', data=data, headers=self.user_headers)
+            except Exception:
+                # the database was too busy to take this one...
+                return None
+            return res.status_code
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(order, range(300)))
+
+        with self.app.app_context():
+            stock = MenuItem.query.get(menu_item['id']).quantity
+            ordered = Order.query.count()
+        self.assertGreaterEqual(stock, 0)
+        self.assertEqual(ordered, statuses.count(201))
+        self.assertEqual(stock + ordered, 100)
+        self.assertGreater(statuses.count(400), 0)
+
+    def test_can_order_a_cart(self):
+        ids = self.create_menu_items(['ugali', 'chapati'])
+        res = self.client.post(
+            'api/v1/orders/cart',
+            data=json.dumps({
+                'user_id': self.user['id'],
+                'items': [
+                    {'menu_item_id': ids[0], 'quantity': 2},
+                    {'menu_item_id': ids[1], 'quantity': 1},
+                    {'menu_item_id': ids[0], 'quantity': 1},
+                ]
+            }),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+        orders = self.to_dict(res)['orders']
+        self.assertEqual(
+            [(order['menu_item_id'], order['quantity']) for order in orders],
+            [(ids[0], 3), (ids[1], 1)])
+        with self.app.app_context():
+            self.assertEqual(MenuItem.stock(ids[0]), 7)
+            self.assertEqual(MenuItem.stock(ids[1]), 9)
+            self.assertEqual(Notification.query.count(), 1)
+
+    def test_cannot_order_a_cart_with_more_than_available(self):
+        ids = self.create_menu_items(['ugali', 'chapati'])
+        # each taken quantity is committed on its own without the unit
+        # of work...
+        with mock.patch.object(TestingConfig, 'UNIT_OF_WORK', False):
+            app = create_app(config_name='testing')
+        for client in [self.client, app.test_client()]:
+            res = client.post(
+                'api/v1/orders/cart',
+                data=json.dumps({
+                    'user_id': self.user['id'],
+                    'items': [
+                        {'menu_item_id': ids[0], 'quantity': 2},
+                        {'menu_item_id': ids[1], 'quantity': 20},
+                    ]
+                }),
+                headers=self.user_headers)
+            self.assertEqual(res.status_code, 400)
+            self.assertIn(b'Only 10 chapati meal(s) are available', res.data)
+            with self.app.app_context():
+                self.assertEqual(MenuItem.stock(ids[0]), 10)
+                self.assertEqual(Order.query.count(), 0)
+
+    def test_cannot_order_a_cart_with_invalid_items(self):
+        ids = self.create_menu_items(['ugali'])
+        for items, error in [
+                ([], b'items field is required'),
+                ([{'menu_item_id': ids[0]}], b'quantity field is required'),
+                ([{'menu_item_id': ids[0], 'quantity': -1}],
+                 b'quantity must be a positive number'),
+                ([{'menu_item_id': ids[0], 'quantity': True}],
+                 b'quantity must be a positive number'),
+                ([{'menu_item_id': 1000, 'quantity': 1}],
+                 b'menu item id 1000 is invalid')]:
+            res = self.client.post(
+                'api/v1/orders/cart',
+                data=json.dumps({'user_id': self.user['id'], 'items': items}),
+                headers=self.user_headers)
+            self.assertEqual(res.status_code, 400)
+            self.assertIn(error, res.data)
+
+    def test_retried_order_is_replayed(self):
+        menu_item = self.create_menu_item()['menu_item']
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'abc'})
+        responses = []
+        for clear_cache in [False, False, True]:
+            if clear_cache:
+                self.app.extensions['idempotency_cache'].clear()
+            responses.append(self.client.post(
+                'api/v1/orders',
+                data=json.dumps({
+                    'quantity': 2,
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item['id']
+                }),
+                headers=headers))
+        self.assertEqual([res.status_code for res in responses], [201] * 3)
+        self.assertNotIn('Idempotent-Replayed', responses[0].headers)
+        self.assertEqual(responses[1].headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(responses[2].headers['Idempotent-Replayed'], 'true')
+        orders = [self.to_dict(res)['order'] for res in responses]
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], orders[2])
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 1)
+            self.assertEqual(Notification.query.count(), 1)
+            self.assertEqual(MenuItem.stock(menu_item['id']), 98)
+
+        # the key cannot be used for another request...
+        res = self.client.put(
+            'api/v1/orders/{}'.format(orders[0]['id']),
+            data=json.dumps({'quantity': 3}),
+            headers=headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_retried_cart_is_replayed(self):
+        ids = self.create_menu_items(['ugali', 'chapati'])
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'cart'})
+        for _ in range(2):
+            res = self.client.post(
+                'api/v1/orders/cart',
+                data=json.dumps({
+                    'user_id': self.user['id'],
+                    'items': [
+                        {'menu_item_id': ids[0], 'quantity': 2},
+                        {'menu_item_id': ids[1], 'quantity': 3},
+                    ]
+                }),
+                headers=headers)
+            self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.headers['Idempotent-Replayed'], 'true')
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 2)
+            self.assertEqual(MenuItem.stock(ids[0]), 8)
+
+    def test_key_reused_with_another_body_is_refused(self):
+        menu_item = self.create_menu_item()['menu_item']
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'abc'})
+        statuses = []
+        for quantity in [2, 3]:
+            for clear_cache in [False, True]:
+                if clear_cache:
+                    self.app.extensions['idempotency_cache'].clear()
+                statuses.append(self.client.post(
+                    'api/v1/orders',
+                    data=json.dumps({
+                        'quantity': quantity,
+                        'user_id': self.user['id'],
+                        'menu_item_id': menu_item['id']
+                    }),
+                    headers=headers).status_code)
+        self.assertEqual(statuses, [201, 201, 422, 422])
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 1)
+
+    def test_response_with_headers_is_replayed(self):
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'abc'})
+        for replayed in [False, True]:
+            res = self.client.post('/idempotent-headers', headers=headers)
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(
+                'Idempotent-Replayed' in res.headers, replayed)
+
+    def test_error_is_not_hidden_by_releasing_the_key(self):
+        self.app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'abc'})
+        with mock.patch.object(IdempotencyKey, 'delete',
+                               side_effect=RuntimeError('delete')):
+            with self.assertRaises(KeyError):
+                self.client.post('/idempotent-error', headers=headers)
+
+    def test_failed_order_is_not_replayed(self):
+        menu_item = self.create_menu_item()['menu_item']
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'abc'})
+        for quantity, status in [(1000, 400), (2, 201)]:
+            res = self.client.post(
+                'api/v1/orders',
+                data=json.dumps({
+                    'quantity': quantity,
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item['id']
+                }),
+                headers=headers)
+            self.assertEqual(res.status_code, status)
+
+    def test_admin_can_accept_pending_orders_at_once(self):
+        ids = self.create_menu_items(['ugali', 'chapati'])
+        with self.app.app_context():
+            for menu_item_id in [ids[0]] * 5 + [ids[1]]:
+                Order.create({
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item_id,
+                    'quantity': 1
+                })
+            Order.query.get(1).update({'status': OrderStatus.REVOKED})
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            res = self.client.put(
+                'api/v1/orders/status',
+                data=json.dumps({'status': OrderStatus.ACCEPTED,
+                                 'menu_item_id': ids[0]}),
+                headers=self.admin_headers)
+        finally:
+            with self.app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['count'], 4)
+        # the notifications, their unread counts and the orders...
+        self.assertEqual(
+            len([s for s in statements if not s.startswith('SELECT')]), 3)
+
+        with self.app.app_context():
+            self.assertEqual(
+                [order.status for order in Order.query.order_by(Order.id)],
+                [OrderStatus.REVOKED] + [OrderStatus.ACCEPTED] * 4 +
+                [OrderStatus.PENDING])
+            notifications = Notification.query.order_by(Notification.id)
+            self.assertEqual(
+                [n.title for n in notifications],
+                ['Order(#{}) status changed'.format(i) for i in range(2, 6)])
+            self.assertEqual(
+                notifications[0].message,
+                'Your order (#2) for ugali with 1 items status has changed '
+                'to Accepted.')
+            self.assertIsNotNone(notifications[0].created_at)
+            self.assertEqual(Notification.unread(self.user['id']), 4)
+
+        # none is pending anymore...
+        res = self.client.put(
+            'api/v1/orders/status',
+            data=json.dumps({'status': OrderStatus.ACCEPTED,
+                             'menu_item_id': ids[0]}),
+            headers=self.admin_headers)
+        self.assertEqual(self.to_dict(res)['count'], 0)
+
+    def test_cannot_accept_orders_of_an_unknown_time(self):
+        ids = self.create_menu_items(['ugali'])
+        with self.app.app_context():
+            Order.create({
+                'user_id': self.user['id'],
+                'menu_item_id': ids[0],
+                'quantity': 1
+            })
+        res = self.client.put(
+            'api/v1/orders/status',
+            data=json.dumps({'status': OrderStatus.ACCEPTED,
+                             'time': 'garbage'}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'The selected time is invalid', res.data)
+        with self.app.app_context():
+            self.assertEqual(Order.query.get(1).status, OrderStatus.PENDING)
+            with self.assertRaises(ValidationException):
+                Order.transition(OrderStatus.ACCEPTED, time='garbage')
+            self.assertEqual(
+                Order.transition(OrderStatus.ACCEPTED, time='all'), 1)
+
+    @unittest.skipUnless(
+        'postgres' in (os.getenv('TEST_DATABASE_URL') or ''),
+        'RETURNING is only used on postgres')
+    def test_accepted_orders_are_returned_by_postgres(self):
+        ids = self.create_menu_items(['ugali', 'chapati'])
+        with self.app.app_context():
+            for menu_item_id in [ids[0]] * 2 + [ids[1]]:
+                Order.create({
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item_id,
+                    'quantity': 1
+                })
+            self.assertEqual(Order.transition(
+                OrderStatus.ACCEPTED, menu_item_id=ids[0]), 2)
+            db.session.commit()
+            self.assertEqual(
+                [n.title for n in Notification.query.order_by(
+                    Notification.id)],
+                ['Order(#1) status changed', 'Order(#2) status changed'])
+            self.assertEqual(Notification.unread(self.user['id']), 2)
+            self.assertEqual(Order.transition(
+                OrderStatus.ACCEPTED, menu_item_id=ids[0]), 0)
+
+    def test_user_cannot_accept_orders(self):
+        res = self.client.put(
+            'api/v1/orders/status',
+            data=json.dumps({'status': OrderStatus.ACCEPTED}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 401)
+
     def test_can_update_order(self):
         json_res = self.create_order()
         res = self.client.put(
@@ -116,6 +441,65 @@ class TestOrders(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Successfully retrieved orders', res.data)
 
+    def test_can_get_many_orders_with_related(self):
+        self.create_order()
+        res = self.client.get(
+            'api/v1/orders?related=user:email|menu_item.meal:name|password',
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        order = self.to_dict(res)['orders'][0]
+        self.assertEqual(order['user'], {'email': 'user@mail.com'})
+        self.assertEqual(order['menu_item']['meal'], {'name': 'ugali'})
+        self.assertNotIn('password', order)
+
+    def test_can_search_orders_by_meal_and_user(self):
+        self.create_order()
+        for term, count in [('uga', 1), ('user', 1), ('beef', 0)]:
+            res = self.client.get(
+                'api/v1/orders?search=' + term, headers=self.admin_headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(self.to_dict(res)['orders']), count)
+
+    def test_todays_menu_tracks_remaining_quantity(self):
+        menu_item = self.create_menu_item()['menu_item']
+        res = self.client.get('api/v1/menus/today', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        json_res = self.to_dict(res)
+        self.assertEqual(
+            json_res['menus'][0]['menu_items'][0]['quantity'], 100)
+
+        # unchanged since...
+        res = self.client.get(
+            'api/v1/menus/today?version={}'.format(json_res['version']),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 304)
+
+        res = self.client.post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': 2,
+                'user_id': self.user['id'],
+                'menu_item_id': menu_item['id']
+            }),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+        res = self.client.get(
+            'api/v1/menus/today?version={}'.format(json_res['version']),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            self.to_dict(res)['menus'][0]['menu_items'][0]['quantity'], 98)
+
+    def test_can_filter_orders_by_time(self):
+        self.create_order()
+        for time, count in [('today', 1), ('history', 0), ('all', 1),
+                            ('2000-01-01', 0)]:
+            res = self.client.get(
+                'api/v1/orders?time={}'.format(time),
+                headers=self.user_headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(self.to_dict(res)['current_count'], count)
+
     def test_can_get_many_orders_history(self):
         json_res = self.create_order()
         res = self.client.get(
@@ -152,6 +536,15 @@ class TestOrders(BaseTest):
         self.assertIn(b'Successfully saved order', res.data)
         return self.to_dict(res)
 
+    def create_menu_items(self, names):
+        with self.app.app_context():
+            menu = Menu.create({'name': 'Lunch'})
+            return [MenuItem.create({
+                'menu_id': menu.id,
+                'meal_id': Meal.create({'name': name, 'cost': 30}).id,
+                'quantity': 10
+            }).id for name in names]
+
     def create_menu_item(self):
         # create a meal
         res = self.client.post(
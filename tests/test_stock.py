@@ -0,0 +1,182 @@
+import os
+import json
+import tempfile
+import multiprocessing
+from unittest import mock
+from flask import abort
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app, db, stock
+from app.models import Meal, Menu, MenuItem, Order
+from app.stock import StockCounters, HEADER, LAYOUT, SERVER_ID
+from .base import BaseTest
+
+
+class TestStock(BaseTest):
+    """This will test the stock counters shared by the workers"""
+
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.path = os.path.join(tempfile.mkdtemp(), 'stock')
+        self.app.config['STOCK_COUNTERS'] = self.path
+        self.app.config['STOCK_FLUSH_INTERVAL'] = None
+        stock.init_app(self.app)
+
+        @self.app.route('/take-and-fail', methods=['POST'])
+        def take_and_fail():
+            stock.take(self.menu_item_id, 30)
+            abort(400)
+
+        @self.app.route('/take-set-and-commit', methods=['POST'])
+        def take_set_and_commit():
+            stock.take(self.menu_item_id, 30)
+            self.app.extensions['stock_counters'].set(self.menu_item_id, 200)
+            return 'taken'
+
+        @self.app.route('/take-while-another-process-flushes',
+                        methods=['POST'])
+        def take_while_another_process_flushes():
+            stock.take(self.menu_item_id, 30)
+            process = multiprocessing.get_context('fork').Process(
+                target=self.flush_elsewhere)
+            process.start()
+            process.join()
+            return str(process.exitcode)
+
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+            meal = Meal.create({'name': 'ugali', 'cost': 30})
+            menu = Menu.create({'name': 'Lunch'})
+            self.menu_item_id = MenuItem.create({
+                'menu_id': menu.id,
+                'meal_id': meal.id,
+                'quantity': 100
+            }).id
+
+    def order(self, quantity=1):
+        return self.app.test_client().post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': quantity,
+                'user_id': self.user['id'],
+                'menu_item_id': self.menu_item_id
+            }),
+            headers=self.user_headers)
+
+    def test_concurrent_orders_cannot_oversell(self):
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(
+                lambda i: self.order().status_code, range(300)))
+        self.assertEqual(statuses.count(201), 100)
+        self.assertEqual(statuses.count(400), 200)
+
+        counters = self.app.extensions['stock_counters']
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 100)
+            # taken from the counters, not yet from the database...
+            self.assertEqual(counters.left(self.menu_item_id), 0)
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 100)
+            self.assertEqual(counters.flush(), 1)
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 0)
+            self.assertEqual(counters.flush(), 0)
+
+    def test_failed_request_puts_back_quantity(self):
+        self.client.post('/take-and-fail')
+        with self.app.app_context():
+            counters = self.app.extensions['stock_counters']
+            self.assertEqual(counters.left(self.menu_item_id), 100)
+            self.assertEqual(counters.flush(), 0)
+
+    def test_deleted_order_puts_back_quantity(self):
+        res = self.order(quantity=1000)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'Only 100 meal(s) are available', res.data)
+
+        res = self.order(quantity=30)
+        self.assertEqual(res.status_code, 201)
+        order_id = self.to_dict(res)['order']['id']
+        res = self.client.delete(
+            'api/v1/orders/{}'.format(order_id), headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            counters = self.app.extensions['stock_counters']
+            self.assertEqual(counters.left(self.menu_item_id), 100)
+
+    def set_quantity(self, quantity):
+        res = self.client.put(
+            'api/v1/menu-items/{}'.format(self.menu_item_id),
+            data=json.dumps({'quantity': quantity}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_quantity_set_replaces_what_is_left(self):
+        counters = self.app.extensions['stock_counters']
+        for flush_first in [False, True]:
+            self.assertEqual(self.order(quantity=30).status_code, 201)
+            with self.app.app_context():
+                if flush_first:
+                    self.assertEqual(counters.flush(), 1)
+                self.set_quantity(200)
+                self.assertEqual(counters.left(self.menu_item_id), 200)
+                # nothing taken before is written over it...
+                self.assertEqual(counters.flush(), 0)
+                self.assertEqual(MenuItem.stock(self.menu_item_id), 200)
+
+    def test_order_taken_before_quantity_set_is_not_written(self):
+        self.client.post('/take-set-and-commit')
+        counters = self.app.extensions['stock_counters']
+        with self.app.app_context():
+            self.assertEqual(counters.left(self.menu_item_id), 200)
+            self.assertEqual(counters.flush(), 0)
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 200)
+
+    def test_quantity_set_updates_todays_menu(self):
+        res = self.client.get('api/v1/menus/today', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.order(quantity=30).status_code, 201)
+        self.set_quantity(200)
+        res = self.client.get('api/v1/menus/today', headers=self.user_headers)
+        self.assertEqual(
+            self.to_dict(res)['menus'][0]['menu_items'][0]['quantity'], 200)
+
+    def flush_elsewhere(self):
+        """Flush the counters as a command sharing the configuration would,
+        in a process of its own"""
+        app = create_app(config_name='testing')
+        app.config['STOCK_COUNTERS'] = self.path
+        stock.init_app(app)
+        with app.app_context():
+            stock.stock_counters().flush()
+
+    def test_other_process_does_not_reset_counters(self):
+        with mock.patch.dict(os.environ, {SERVER_ID: '1'}):
+            stock.serve(self.app)
+        counters = self.app.extensions['stock_counters']
+        self.assertEqual(self.order(quantity=20).status_code, 201)
+        res = self.client.post('/take-while-another-process-flushes')
+        self.assertEqual(res.data, b'0')
+        with self.app.app_context():
+            self.assertEqual(counters.left(self.menu_item_id), 50)
+            # taken by the order, written by the other process...
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 80)
+            self.assertEqual(counters.flush(), 1)
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 50)
+
+    def test_restarted_server_writes_what_was_taken(self):
+        self.assertEqual(self.order(quantity=30).status_code, 201)
+        self.app.extensions['stock_counters'].close()
+
+        # as if opened by another server...
+        with open(self.path, 'r+b') as f:
+            f.write(HEADER.pack(0, LAYOUT))
+        counters = StockCounters(self.path, server=1)
+        with self.app.app_context():
+            self.assertEqual(counters.left(self.menu_item_id), 70)
+            self.assertEqual(MenuItem.stock(self.menu_item_id), 70)
+        counters.close()
+
+    def tearDown(self):
+        self.app.extensions['stock_counters'].close()
+        with self.app.app_context():
+            db.drop_all()
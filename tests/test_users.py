@@ -1,6 +1,9 @@
 import json
+from unittest import mock
 from app import create_app, db
 from app.models import User, UserType
+from app.cache import identity_cache, token_versions
+from app.utils import current_user
 from .base import BaseTest
 
 
@@ -70,6 +73,55 @@ class TestUsers(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'User successfully updated', res.data)
 
+    def test_updated_role_takes_effect(self):
+        res = self.client.get('api/v1/users', headers=self.user_headers)
+        self.assertEqual(res.status_code, 401)
+        res = self.client.put(
+            'api/v1/users/{}'.format(self.user['id']),
+            data=json.dumps({'role': UserType.ADMIN}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get('api/v1/users', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_demoted_admin_loses_access(self):
+        other, other_headers = self.authAdmin(email='other@mail.com')
+        res = self.client.get('api/v1/users', headers=other_headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.put(
+            'api/v1/users/{}'.format(other['id']),
+            data=json.dumps({'role': UserType.USER}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get('api/v1/users', headers=other_headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_changed_email_forgets_both_identities(self):
+        with self.app.app_context():
+            cache = identity_cache()
+            user = User.query.get(self.user['id'])
+            for email in ['user@mail.com', 'jane@mail.com']:
+                cache.set(email, user.to_cache())
+            user.update({'email': 'jane@mail.com'})
+            self.assertIsNone(cache.get('user@mail.com'))
+            self.assertIsNone(cache.get('jane@mail.com'))
+
+    def test_user_without_token_version_is_authorized_by_claims(self):
+        with self.app.app_context():
+            db.session.execute(User.__table__.update().where(
+                User.id == self.admin['id']).values(token_version=None))
+            db.session.commit()
+            token_versions().clear()
+        with mock.patch('app.utils.current_user',
+                        wraps=current_user) as load:
+            for _ in range(2):
+                res = self.client.get(
+                    'api/v1/users', headers=self.admin_headers)
+                self.assertEqual(res.status_code, 200)
+        load.assert_not_called()
+        with self.app.app_context():
+            self.assertEqual(token_versions().get(self.admin['id']), 0)
+
     def test_can_delete_user(self):
         res = self.client.delete('api/v1/users/1', headers=self.admin_headers)
         self.assertEqual(res.status_code, 200)